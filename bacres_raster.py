@@ -0,0 +1,104 @@
+import math
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import geopandas as gpd
+import rasterio
+from rasterio.features import rasterize
+from rasterio.windows import Window, from_bounds
+from shapely.geometry import box
+
+from stage_io import read_layer
+
+SQ_METERS_PER_ACRE = 4046.86
+# Clipped rasters go here rather than next to the statewide rasters, which live in a synced folder
+SCRATCH_DIR = os.environ.get('BACRES_SCRATCH_DIR', os.path.join(tempfile.gettempdir(), 'bacres_scratch'))
+
+
+def parcel_window(src, parcels, halo_pixels=0):
+    # Pixel window covering the parcels' bounds plus halo_pixels on every side, limited to the raster
+    window = from_bounds(*parcels.to_crs(src.crs).total_bounds, transform=src.transform)
+    col_off = math.floor(window.col_off) - halo_pixels
+    row_off = math.floor(window.row_off) - halo_pixels
+    width = math.ceil(window.col_off + window.width) + halo_pixels - col_off
+    height = math.ceil(window.row_off + window.height) + halo_pixels - row_off
+    return Window(col_off, row_off, width, height).intersection(Window(0, 0, src.width, src.height))
+
+
+def clip_raster_window(raster_file, parcels, halo_pixels=0, scratch_dir=None):
+    # Read only the block of the raster under the parcels (plus a halo) and save it as a GeoTIFF in
+    # the scratch directory, so the cost follows the county's extent rather than the statewide raster.
+    # Every call gets its own file, so concurrent runs do not overwrite each other; callers pass a
+    # scratch_run_dir() so the file is removed when their run ends.
+    scratch_dir = Path(scratch_dir or SCRATCH_DIR)
+    scratch_dir.mkdir(parents=True, exist_ok=True)
+
+    with rasterio.open(raster_file) as src:
+        window = parcel_window(src, parcels, halo_pixels)
+        out_image = src.read(window=window)
+        out_meta = src.meta.copy()
+        out_meta.update({
+            "driver": "GTiff",
+            "height": out_image.shape[1],
+            "width": out_image.shape[2],
+            "transform": src.window_transform(window)
+        })
+
+    fd, clipped_raster_file = tempfile.mkstemp(prefix=Path(raster_file).stem + "_", suffix="_clipped.tif",
+                                               dir=scratch_dir)
+    os.close(fd)
+    with rasterio.open(clipped_raster_file, "w", **out_meta) as dest:
+        dest.write(out_image)
+
+    return clipped_raster_file
+
+
+def scratch_run_dir():
+    # Per-run directory in SCRATCH_DIR for clipped rasters and the files derived from them; it is
+    # removed with everything in it when the with-block ends, also after an error
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    return tempfile.TemporaryDirectory(prefix='bacres_run_', dir=SCRATCH_DIR)
+
+
+def read_wetlands_near(wetlands_file, parcels):
+    # Read only the wetlands overlapping the parcels' extent (the bbox is reprojected to the file's CRS)
+    extent = gpd.GeoSeries([box(*parcels.total_bounds)], crs=parcels.crs)
+    return read_layer(wetlands_file, bbox=extent)
+
+
+def zonal_buildable_pixels(parcels, raster_file, is_nonbuildable, wetlands=None):
+    # Count, for every parcel, the pixels it covers and how many of them are buildable, by burning the
+    # parcels (and wetlands) onto the raster grid instead of polygonizing it.
+    # is_nonbuildable maps the raster values to a boolean array of unbuildable pixels.
+    # Returns (total_pixels, buildable_pixels, pixel_area_sq_meters); the arrays follow the parcels' order.
+    with rasterio.open(raster_file) as src:
+        values = src.read(1)
+        transform = src.transform
+        crs = src.crs
+
+    parcels = parcels.to_crs(crs)
+    nonbuildable = np.asarray(is_nonbuildable(values), dtype=bool)
+
+    if wetlands is not None and not wetlands.empty:
+        wetlands = wetlands.to_crs(crs)
+        wetland_shapes = ((geom, 1) for geom in wetlands.geometry if geom is not None and not geom.is_empty)
+        nonbuildable |= rasterize(wetland_shapes, out_shape=values.shape, transform=transform, fill=0,
+                                  dtype='uint8').astype(bool)
+
+    # Zone 0 is background; parcel i is burned as i + 1 (later parcels win where parcels overlap)
+    parcel_shapes = [(geom, i) for i, geom in enumerate(parcels.geometry, start=1)
+                     if geom is not None and not geom.is_empty]
+    zones = np.zeros(values.shape, dtype='int32')
+    if parcel_shapes:
+        zones = rasterize(parcel_shapes, out_shape=values.shape, transform=transform, fill=0, dtype='int32')
+
+    total_pixels = np.bincount(zones.ravel(), minlength=len(parcels) + 1)[1:]
+    buildable_pixels = np.bincount(zones[~nonbuildable], minlength=len(parcels) + 1)[1:]
+
+    # Pixel size is in the raster CRS units; convert to metres (e.g. for US survey feet rasters)
+    unit_factor = crs.linear_units_factor[1] if crs.is_projected else 1.0
+    pixel_area = abs(transform.a * transform.e) * unit_factor ** 2
+
+    return total_pixels, buildable_pixels, pixel_area
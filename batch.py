@@ -0,0 +1,152 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from reportall_client import PageCache, STATE_MAPPING
+from pipeline import run_fetch_stage, run_processing_stages, STAGES, DEFAULT_CACHE_DIR, BACRES_ENGINES
+from stage_io import stage_formats, FORMATS
+
+# County FIPS codes (county_id) for each state prefix in STATE_MAPPING
+STATE_COUNTY_IDS = {
+    # Ohio's 88 counties are numbered 001-175 by odd numbers
+    '39': [f"39{code:03d}" for code in range(1, 176, 2)],
+    # Virginia's 95 counties followed by its 38 independent cities
+    '51': [f"51{code:03d}" for code in (
+        1, 3, 5, 7, 9, 11, 13, 15, 17, 19, 21, 23, 25, 27, 29, 31, 33, 35, 36, 37, 41, 43, 45, 47, 49, 51, 53,
+        57, 59, 61, 63, 65, 67, 69, 71, 73, 75, 77, 79, 81, 83, 85, 87, 89, 91, 93, 95, 97, 99, 101, 103,
+        105, 107, 109, 111, 113, 115, 117, 119, 121, 125, 127, 131, 133, 135, 137, 139, 141, 143, 145, 147,
+        149, 153, 155, 157, 159, 161, 163, 165, 167, 169, 171, 173, 175, 177, 179, 181, 183, 185, 187, 191,
+        193, 195, 197, 199,
+        510, 520, 530, 540, 550, 570, 580, 590, 595, 600, 610, 620, 630, 640, 650, 660, 670, 678, 680, 683,
+        685, 690, 700, 710, 720, 730, 735, 740, 750, 760, 770, 775, 790, 800, 810, 820, 830, 840)],
+}
+
+# Downloads run on threads in the main process while the CPU-bound stages run on the process pool
+FETCH_WORKERS = 4
+MANIFEST_NAME = 'batch_manifest.json'
+
+
+def expand_county_ids(selectors):
+    # Accept county IDs ('39091'), state prefixes ('39') or state codes ('OH')
+    state_prefixes = {code: prefix for prefix, code in STATE_MAPPING.items()}
+    county_ids = []
+    for selector in selectors:
+        prefix = state_prefixes.get(selector.upper(), selector)
+        if prefix in STATE_COUNTY_IDS:
+            county_ids.extend(STATE_COUNTY_IDS[prefix])
+        else:
+            county_ids.append(selector)
+    return list(dict.fromkeys(county_ids))
+
+
+def run_batch(county_ids, out_dir, calc_acreage_min='', write=('clean',), cache=None, max_workers=None,
+              fetch_workers=FETCH_WORKERS, max_distance_miles=None, incremental=False, formats=None, compact=True,
+              multi_proximity=False, engine=None):
+    # Fetch every county on a thread pool and hand each fetched county to a process pool for
+    # proximity, buildable acres and scoring as soon as it arrives, so downloads overlap the CPU work.
+    # Each county writes into its own folder under out_dir; a manifest of outputs and timings is
+    # written to out_dir/batch_manifest.json and returned.
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    started_at = time.strftime('%Y-%m-%d %H:%M:%S')
+    started = time.perf_counter()
+    summaries = {}
+
+    def failed(county_id, stage, error):
+        logging.error(f"{county_id}: {stage} failed: {error}")
+        return {'county_id': county_id, 'status': 'error', 'failed_stage': stage, 'error': str(error)}
+
+    # Workers are spawned rather than forked: they start while the fetch threads are mid-request, and a
+    # forked child can inherit a lock one of those threads was holding
+    spawn = multiprocessing.get_context('spawn')
+    with ThreadPoolExecutor(max_workers=fetch_workers) as fetch_pool, \
+            ProcessPoolExecutor(max_workers=max_workers, mp_context=spawn) as process_pool:
+        fetches = {fetch_pool.submit(run_fetch_stage, county_id, out_dir / county_id, '', '', calc_acreage_min,
+                                     write, cache, formats, compact): county_id
+                   for county_id in county_ids}
+        processing = {}
+
+        for future in as_completed(fetches):
+            county_id = fetches[future]
+            try:
+                parcels, summary = future.result()
+            except Exception as e:
+                summaries[county_id] = failed(county_id, 'fetch', e)
+                continue
+
+            print(f"Fetched {county_id}: {summary['stages']['fetch']['rows']} parcels")
+            if parcels is None:
+                summaries[county_id] = summary
+                continue
+            processing[process_pool.submit(run_processing_stages, parcels, summary, out_dir / county_id, write,
+                                           max_distance_miles, incremental, formats, multi_proximity,
+                                           engine)] = county_id
+
+        for future in as_completed(processing):
+            county_id = processing[future]
+            try:
+                summaries[county_id] = future.result()
+            except Exception as e:
+                summaries[county_id] = failed(county_id, 'processing', e)
+                continue
+            print(f"Processed {county_id}: {summaries[county_id]['status']}")
+
+    manifest = {
+        'started': started_at,
+        'total_seconds': round(time.perf_counter() - started, 3),
+        'counties': [summaries[county_id] for county_id in county_ids]
+    }
+    with open(out_dir / MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the parcel prospecting chain for many counties at once.")
+    parser.add_argument('counties', nargs='+', help="county IDs, state prefixes (39) or state codes (OH)")
+    parser.add_argument('--acreage-min', default='')
+    parser.add_argument('--out-dir', default='.')
+    parser.add_argument('--write', nargs='+', choices=STAGES, default=['clean'],
+                        help="stages whose output is saved to disk")
+    parser.add_argument('--workers', type=int, default=None, help="processes for the CPU-bound stages")
+    parser.add_argument('--fetch-workers', type=int, default=FETCH_WORKERS)
+    parser.add_argument('--max-distance-miles', type=float, default=None)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--multi-proximity', action='store_true',
+                        help="also measure the nearest lines and the closest line per voltage class")
+    parser.add_argument('--engine', choices=BACRES_ENGINES, default=None,
+                        help="buildable acres engine (default: the state script's BACRES_ENGINE)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="reuse each county's previous results for parcels that have not changed")
+    parser.add_argument('--offline', action='store_true', help="replay cached API pages only")
+    parser.add_argument('--all-columns', action='store_true',
+                        help="keep every API column instead of only those the stages use")
+    parser.add_argument('--format', nargs='+', default=[], metavar='STAGE=FORMAT',
+                        help=f"format of written stage outputs ({', '.join(FORMATS)}; default gpkg), "
+                             f"e.g. proximity=parquet bacres=parquet")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, filename='batch_debug.log', filemode='w',
+                        format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+    county_ids = expand_county_ids(args.counties)
+    print(f"Running {len(county_ids)} counties")
+    cache = PageCache(args.cache_dir, offline=args.offline)
+    manifest = run_batch(county_ids, args.out_dir, args.acreage_min, args.write, cache, args.workers,
+                         args.fetch_workers, args.max_distance_miles, args.incremental, stage_formats(args.format),
+                         not args.all_columns, args.multi_proximity, args.engine)
+
+    failures = [county for county in manifest['counties'] if county['status'] == 'error']
+    print(f"Finished {len(county_ids)} counties in {manifest['total_seconds']:.0f}s ({len(failures)} failed)")
+    print(f"Manifest written to {Path(args.out_dir) / MANIFEST_NAME}")
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -0,0 +1,107 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parcel_cleaning import clean_columns, sanitize_addr_number, format_whole_number  # noqa: E402
+
+
+# Row-by-row text normalization as process_csv did it before clean_columns, kept as the baseline
+def legacy_clean_columns(df):
+    if 'addr_number' in df.columns:
+        df['addr_number'] = df['addr_number'].apply(sanitize_addr_number)
+
+    if all(col in df.columns for col in ['addr_number', 'addr_street_name', 'addr_street_type']):
+        df['full_address'] = df['addr_number'].astype(str) + ' ' + df['addr_street_name'].fillna('') + ' ' + df['addr_street_type'].fillna('')
+        df['full_address'] = df['full_address'].apply(lambda x: str(x).title())
+
+    columns_to_propercase = ['physcity', 'owner', 'mail_address1', 'mail_address3']
+    for col in columns_to_propercase:
+        if col in df.columns:
+            df[col] = df[col].apply(lambda x: str(x).title() if pd.notnull(x) else x)
+
+    def split_mail_address(address):
+        if pd.isnull(address):
+            return pd.Series([None, None, None])
+        parts = address.rsplit(' ', 2)
+        if len(parts) < 3:
+            return pd.Series([None, None, None])
+        return pd.Series([parts[0], parts[1], parts[2]])
+
+    if 'mail_address3' in df.columns:
+        df[['mail_city', 'mail_state', 'mail_zip']] = df['mail_address3'].apply(split_mail_address)
+
+    if 'mail_state' in df.columns:
+        df['mail_state'] = df['mail_state'].apply(lambda x: str(x).upper() if pd.notnull(x) else x)
+
+    if 'acreage_calc' in df.columns:
+        df['acreage_calc'] = df['acreage_calc'].apply(format_whole_number)
+    if 'acreage_adjacent_with_sameowner' in df.columns:
+        df['acreage_adjacent_with_sameowner'] = df['acreage_adjacent_with_sameowner'].fillna(0).astype(int)
+
+    return df
+
+
+def synthetic_parcels(rows, seed=0):
+    # Address and owner columns shaped like a ReportAll export, with some missing values
+    rng = np.random.default_rng(seed)
+    cities = np.array(['BELLEFONTAINE', 'west liberty', 'Russells Point', 'DE GRAFF', 'lakeview'])
+    streets = np.array(['COUNTY ROAD 10', 'state route 47', 'Main', 'TOWNSHIP RD 5'])
+    street_types = np.array(['RD', 'st', 'AVE', None], dtype=object)
+    owners = np.array(["SMITH JOHN & MARY", "o'neil farms llc", 'ACME AG TRUST', 'doe jane'])
+    mail_3 = np.array(['BELLEFONTAINE OH 43311', 'columbus oh 43215', 'PO BOX', None], dtype=object)
+
+    def pick(values, missing=0.0):
+        column = values[rng.integers(0, len(values), rows)].astype(object)
+        column[rng.random(rows) < missing] = None
+        return column
+
+    addr_number = rng.integers(1, 20000, rows).astype(float)
+    addr_number[rng.random(rows) < 0.1] = np.nan
+
+    return pd.DataFrame({
+        'owner': pick(owners, 0.01),
+        'physcity': pick(cities, 0.05),
+        'addr_number': addr_number,
+        'addr_street_name': pick(streets, 0.05),
+        'addr_street_type': pick(street_types),
+        'mail_address1': pick(streets, 0.02),
+        'mail_address3': pick(mail_3),
+        'acreage_calc': rng.random(rows) * 1000,
+        'acreage_adjacent_with_sameowner': np.where(rng.random(rows) < 0.5, np.nan, rng.random(rows) * 500),
+    })
+
+
+def time_rows_per_second(func, df):
+    start = time.perf_counter()
+    result = func(df.copy())
+    elapsed = time.perf_counter() - start
+    return result, len(df) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark clean_csv text normalization, before and after.")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--string-dtype', default=None, help="e.g. 'pyarrow' for Arrow-backed strings")
+    args = parser.parse_args()
+
+    df = synthetic_parcels(args.rows)
+
+    legacy, legacy_rate = time_rows_per_second(legacy_clean_columns, df)
+    vectorized, vectorized_rate = time_rows_per_second(lambda d: clean_columns(d, args.string_dtype), df)
+
+    identical = legacy.to_csv(index=False) == vectorized.to_csv(index=False)
+    print(f"rows: {args.rows}")
+    print(f"row-by-row: {legacy_rate:,.0f} rows/s")
+    print(f"vectorized: {vectorized_rate:,.0f} rows/s ({vectorized_rate / legacy_rate:.1f}x)")
+    print(f"identical CSV output: {identical}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import new_report, stage  # noqa: E402
+
+from synthetic import write_dataset  # noqa: E402
+from stub_api import StubReportAll  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+STAGE_NAMES = ['fetch', 'proximity', 'proximity_multi', 'slope_oh', 'difference_oh', 'bacres_va', 'bacres_va_raster', 'clean',
+               'handoff_gpkg', 'handoff_parquet']
+# A stage regresses when its throughput drops, or its peak memory grows, by more than this fraction
+DEFAULT_TOLERANCE = 0.2
+
+
+def run_stage(name, paths, api_url=None):
+    # Load the stage's inputs, then measure only the call under test. Runs in a fresh process so
+    # peak RSS belongs to this stage alone. Returns the stage record, or None if it cannot run here.
+    import geopandas as gpd
+
+    report = new_report()
+    parcels = gpd.read_parquet(paths['parcels'])
+
+    if name == 'fetch':
+        from reportall_client import iter_pages, build_query_params
+        from parcel_ingest import results_to_geodataframe
+        with stage(name, report) as record:
+            results = []
+            for page_results in iter_pages(api_url, build_query_params('39091')):
+                results.extend(page_results)
+            record['rows'] = len(results_to_geodataframe(results, compact=True))
+
+    elif name in ('proximity', 'proximity_multi'):
+        from tx_proximity import add_transmission_line_distances, NEAREST_LINE_COUNT, VOLTAGE_CLASSES_KV
+        multi = {'nearest_count': NEAREST_LINE_COUNT, 'voltage_classes': VOLTAGE_CLASSES_KV} \
+            if name == 'proximity_multi' else {}
+        with stage(name, report) as record:
+            record['rows'] = len(add_transmission_line_distances(
+                parcels, transmission_lines_file=paths['lines'],
+                transmission_lines_store=os.path.join(paths['workdir'], 'no_line_store'), **multi))
+
+    elif name in ('slope_oh', 'difference_oh'):
+        try:
+            import calc_bacres_OH
+        except ImportError as e:
+            print(f"  skipping {name}: {e}")
+            return None
+        if name == 'slope_oh':
+            with stage(name, report) as record:
+                calc_bacres_OH.calculate_slope(paths['dem'])
+                record['rows'] = len(parcels)
+        else:
+            import numpy as np
+            import rasterio
+            from rasterio.features import shapes
+            from shapely.geometry import shape
+            with rasterio.open(paths['slope_classes']) as src:
+                image = src.read(1)
+                steep = [shape(s) for s, _ in shapes(image, mask=(image == 0), transform=src.transform)]
+                slope_gdf = gpd.GeoDataFrame({'DN': np.full(len(steep), 100)}, geometry=steep, crs=src.crs)
+            parcels = parcels.to_crs(slope_gdf.crs)
+            with stage(name, report) as record:
+                calc_bacres_OH.calculate_difference(parcels, slope_gdf, paths['wetlands'])
+                record['rows'] = len(parcels)
+
+    elif name in ('bacres_va', 'bacres_va_raster'):
+        import calc_bacres_VA
+        engine = 'raster' if name == 'bacres_va_raster' else 'vector'
+        with stage(name, report) as record:
+            record['rows'] = len(calc_bacres_VA.compute_bacres(parcels, paths['slope_classes'], paths['wetlands'],
+                                                               engine=engine, nonbuildable_mask_file=None))
+
+    elif name == 'clean':
+        from parcel_cleaning import process_csv
+        output_file = os.path.join(paths['workdir'], 'parcels_clean.csv')
+        with stage(name, report) as record:
+            process_csv(paths['scored_csv'], output_file)
+            record['rows'] = len(parcels)
+
+    elif name.startswith('handoff_'):
+        # Write one stage's output and read it back the way the next stage does
+        from stage_io import write_layer, read_layer, FORMATS
+        handoff_file = os.path.join(paths['workdir'], 'handoff' + FORMATS[name[len('handoff_'):]])
+        with stage(name, report) as record:
+            record['rows'] = len(read_layer(write_layer(parcels, handoff_file)))
+
+    record = report['stages'][name]
+    record['rows_per_second'] = round(record['rows'] / record['wall_seconds'], 1) if record['wall_seconds'] else None
+    return record
+
+
+def run_size(parcel_count, stages, workdir, seed=0):
+    print(f"Generating {parcel_count} synthetic parcels in {workdir}...")
+    paths = write_dataset(workdir, parcel_count, seed)
+    paths['workdir'] = str(workdir)
+
+    import geopandas as gpd
+    results = {}
+    with StubReportAll(gpd.read_parquet(paths['parcels'])) as stub:
+        for name in stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                record = pool.submit(run_stage, name, paths, stub.url).result()
+            if record is None:
+                continue
+            results[name] = record
+            print(f"  {name}: {record['rows']} rows in {record['wall_seconds']:.2f}s "
+                  f"({record['rows_per_second']:,.0f} rows/s, peak rss {record['peak_rss_mb']} MB)")
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    # Returns a list of human-readable regressions against the saved baseline
+    regressions = []
+    for size, stages in results.items():
+        for name, record in stages.items():
+            saved = baseline.get(size, {}).get(name)
+            if saved is None:
+                continue
+            if saved.get('rows_per_second') and record['rows_per_second'] < saved['rows_per_second'] * (1 - tolerance):
+                regressions.append(f"{size} parcels, {name}: {record['rows_per_second']:,.0f} rows/s "
+                                   f"vs baseline {saved['rows_per_second']:,.0f}")
+            if saved.get('peak_rss_mb') and record['peak_rss_mb'] and \
+                    record['peak_rss_mb'] > saved['peak_rss_mb'] * (1 + tolerance):
+                regressions.append(f"{size} parcels, {name}: peak rss {record['peak_rss_mb']} MB "
+                                   f"vs baseline {saved['peak_rss_mb']} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic counties.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="parcel counts to generate")
+    parser.add_argument('--stages', nargs='+', choices=STAGE_NAMES, default=STAGE_NAMES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=None, help="where synthetic inputs are written (default: a temp dir)")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=None, help="saved results to compare against")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        workdir = Path(args.workdir or temp_dir)
+        results = {str(size): run_size(size, args.stages, workdir / str(size), args.seed) for size in args.sizes}
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import json
+import math
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import geopandas as gpd
+import pandas as pd
+
+# Records per page, like the live parcels endpoint
+PAGE_SIZE = 1000
+
+
+class StubReportAll:
+    # Local stand-in for the ReportAll parcels API: serves a GeoDataFrame as paged JSON with the same
+    # 'count'/'results' layout and WKT geometry, optionally adding a fixed latency per request.
+    # failures maps a page number to the error statuses (e.g. [429, 503]) returned, one per request,
+    # before that page is served; requests counts the requests received per page.
+    def __init__(self, parcels, page_size=PAGE_SIZE, latency=0.0, port=0, failures=None):
+        records = pd.DataFrame(parcels.drop(columns=parcels.geometry.name))
+        records['geom_as_wkt'] = parcels.geometry.to_wkt()
+        records = records.astype(object).where(records.notna(), None)
+        self.pages = [json.dumps({'count': len(records), 'page': page + 1,
+                                  'results': records.iloc[start:start + page_size].to_dict('records')}).encode()
+                      for page, start in enumerate(range(0, len(records), page_size))]
+        self.latency = latency
+        self.failures = {page: list(statuses) for page, statuses in (failures or {}).items()}
+        self.requests = {}
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                page = int(parse_qs(urlparse(self.path).query).get('page', ['1'])[0])
+                if stub.latency:
+                    time.sleep(stub.latency)
+                with stub.lock:
+                    stub.requests[page] = stub.requests.get(page, 0) + 1
+                    status = stub.failures[page].pop(0) if stub.failures.get(page) else None
+                if status is not None:
+                    self.send_response(status)
+                    self.send_header('Retry-After', '0')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = stub.pages[page - 1] if 1 <= page <= len(stub.pages) else b'{"count": 0, "results": []}'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/parcels"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python stub_api.py <parcels.parquet> [port]")
+        sys.exit(1)
+    parcels = gpd.read_parquet(sys.argv[1])
+    with StubReportAll(parcels, port=int(sys.argv[2]) if len(sys.argv) == 3 else 8000) as stub:
+        print(f"Serving {len(parcels)} parcels in {math.ceil(len(parcels) / PAGE_SIZE)} pages at {stub.url}")
+        stub.thread.join()
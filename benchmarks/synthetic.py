@@ -0,0 +1,134 @@
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio
+from affine import Affine
+from shapely.geometry import LineString, Point, box
+
+from bench_clean_csv import synthetic_parcels
+
+# Synthetic county laid out in UTM zone 17N (central Ohio), so the code under test sees real-world coordinates
+CRS = "EPSG:32617"
+ORIGIN = (300000.0, 4400000.0)
+PARCEL_SPACING = 250.0
+DEM_PIXEL_SIZE = 30.0
+# Percent slope above which a pixel counts as steep
+STEEP_SLOPE = 15
+
+
+def county_extent(parcel_count):
+    side = math.ceil(math.sqrt(parcel_count)) * PARCEL_SPACING
+    return ORIGIN[0], ORIGIN[1], ORIGIN[0] + side, ORIGIN[1] + side
+
+
+def generate_parcels(parcel_count, seed=0):
+    # Jittered grid of rectangular parcels with ReportAll-style attributes, in EPSG:4326 like the API
+    rng = np.random.default_rng(seed)
+    per_row = math.ceil(math.sqrt(parcel_count))
+    cells = np.arange(parcel_count)
+    x = ORIGIN[0] + (cells % per_row) * PARCEL_SPACING + rng.random(parcel_count) * 40
+    y = ORIGIN[1] + (cells // per_row) * PARCEL_SPACING + rng.random(parcel_count) * 40
+    width = 120 + rng.random(parcel_count) * 80
+    height = 120 + rng.random(parcel_count) * 80
+    geometries = [box(x0, y0, x0 + w, y0 + h) for x0, y0, w, h in zip(x, y, width, height)]
+
+    attributes = synthetic_parcels(parcel_count, seed)
+    attributes['acreage_calc'] = width * height / 4046.86
+    attributes['parcel_id'] = [f"{seed:02d}-{i:07d}" for i in cells]
+    attributes['county_id'] = '39091'
+    attributes['county_name'] = 'Logan'
+    attributes['state_abbr'] = 'OH'
+    attributes['land_use_class'] = np.where(rng.random(parcel_count) < 0.05, 'Tax Exempt', 'Agricultural')
+    attributes['land_use_code'] = rng.choice(['100', '110', '120', '199', '500'], parcel_count)
+    attributes['mkt_val_land'] = (rng.random(parcel_count) * 500000).round()
+
+    parcels = gpd.GeoDataFrame(attributes, geometry=geometries, crs=CRS)
+    centroids = parcels.geometry.centroid.to_crs("EPSG:4326")
+    parcels['latitude'] = centroids.y
+    parcels['longitude'] = centroids.x
+    return parcels.to_crs("EPSG:4326")
+
+
+def generate_transmission_lines(parcel_count, seed=0):
+    # Straight lines crossing the county, roughly one per 500 parcels, with common voltage classes
+    rng = np.random.default_rng(seed + 1)
+    minx, miny, maxx, maxy = county_extent(parcel_count)
+    count = max(5, parcel_count // 500)
+    starts = np.column_stack([rng.uniform(minx, maxx, count), np.full(count, miny)])
+    ends = np.column_stack([rng.uniform(minx, maxx, count), np.full(count, maxy)])
+    geometries = [LineString([tuple(a), tuple(b)]) for a, b in zip(starts, ends)]
+    voltages = rng.choice([69.0, 138.0, 230.0, 345.0, 765.0], count)
+    return gpd.GeoDataFrame({'VOLTAGE': voltages}, geometry=geometries, crs=CRS)
+
+
+def generate_wetlands(parcel_count, seed=0):
+    # Round wetland patches, roughly one per 5 parcels
+    rng = np.random.default_rng(seed + 2)
+    minx, miny, maxx, maxy = county_extent(parcel_count)
+    count = max(10, parcel_count // 5)
+    centers = zip(rng.uniform(minx, maxx, count), rng.uniform(miny, maxy, count), rng.uniform(20, 120, count))
+    return gpd.GeoDataFrame({'WETLAND_TY': ['Freshwater Emergent Wetland'] * count},
+                            geometry=[Point(x, y).buffer(r) for x, y, r in centers], crs=CRS)
+
+
+def generate_dem(parcel_count, seed=0):
+    # Smooth rolling terrain (elevation in metres) with some steep ridges, plus its geotransform
+    rng = np.random.default_rng(seed + 3)
+    minx, miny, maxx, maxy = county_extent(parcel_count)
+    cols = math.ceil((maxx - minx) / DEM_PIXEL_SIZE) + 1
+    rows = math.ceil((maxy - miny) / DEM_PIXEL_SIZE) + 1
+    yy, xx = np.mgrid[0:rows, 0:cols].astype('float32')
+
+    dem = np.zeros((rows, cols), dtype='float32') + 250
+    for _ in range(6):
+        fx, fy = rng.uniform(0.02, 0.12, 2)
+        amplitude = rng.uniform(10, 50)
+        dem += amplitude * np.sin(xx * fx + rng.uniform(0, 6)) * np.cos(yy * fy + rng.uniform(0, 6))
+
+    transform = Affine(DEM_PIXEL_SIZE, 0, minx, 0, -DEM_PIXEL_SIZE, miny + rows * DEM_PIXEL_SIZE)
+    return dem, transform
+
+
+def slope_classes(dem):
+    # Reclassified slope like VA's SlopeReclass.tif: 0 where steeper than STEEP_SLOPE percent, 1 elsewhere
+    dz_dy, dz_dx = np.gradient(dem, DEM_PIXEL_SIZE)
+    slope_pc = np.hypot(dz_dx, dz_dy) * 100
+    return np.where(slope_pc > STEEP_SLOPE, 0, 1).astype('uint8')
+
+
+def write_raster(path, array, transform):
+    with rasterio.open(path, 'w', driver='GTiff', height=array.shape[0], width=array.shape[1], count=1,
+                       dtype=array.dtype, crs=CRS, transform=transform, tiled=True) as dst:
+        dst.write(array, 1)
+
+
+def write_dataset(out_dir, parcel_count, seed=0):
+    # Write every synthetic input for one size to out_dir and return their paths
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = {name: str(out_dir / file_name) for name, file_name in [
+        ('parcels', 'parcels.parquet'), ('lines', 'transmission_lines.gpkg'), ('wetlands', 'wetlands.gpkg'),
+        ('dem', 'dem.tif'), ('slope_classes', 'slope_reclass.tif'), ('scored_csv', 'parcels_2m_buildable_acres.csv'),
+    ]}
+
+    parcels = generate_parcels(parcel_count, seed)
+    parcels.to_parquet(paths['parcels'])
+    generate_transmission_lines(parcel_count, seed).to_file(paths['lines'], driver='GPKG')
+    generate_wetlands(parcel_count, seed).to_file(paths['wetlands'], driver='GPKG')
+
+    dem, transform = generate_dem(parcel_count, seed)
+    write_raster(paths['dem'], dem, transform)
+    write_raster(paths['slope_classes'], slope_classes(dem), transform)
+
+    # Input for the scoring stage: what calc_bacres hands to clean_csv
+    rng = np.random.default_rng(seed + 4)
+    scored = pd.DataFrame(parcels.drop(columns='geometry'))
+    scored['distance_to_transmission_line_miles'] = (rng.random(parcel_count) * 2).round(2)
+    scored['voltage_of_closest_line'] = rng.choice([69, 138, 230, 345], parcel_count)
+    scored['Bacres'] = (scored['acreage_calc'] * rng.random(parcel_count)).astype(int)
+    scored.to_csv(paths['scored_csv'], index=False)
+
+    return paths
@@ -1,11 +1,17 @@
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import shapely
 from pathlib import Path
 import rasterio
-from rasterio.mask import mask
 from rasterio.features import shapes
 from shapely.geometry import box
 from osgeo import gdal
+from bacres_raster import zonal_buildable_pixels, read_wetlands_near, clip_raster_window, scratch_run_dir
+from slope_cache import slope_cache_is_current, ensure_slope_cache
+from nonbuildable_mask import mask_is_current, ensure_nonbuildable_mask, polygonize_mask, NONBUILDABLE
+from instrumentation import stage
+from stage_io import read_layer, write_layer, stage_format, stage_output_path
 import sys
 import os
 import subprocess
@@ -15,25 +21,27 @@ from tkinter import filedialog, messagebox
 # Enable GDAL exceptions
 gdal.UseExceptions()
 
-def clip_raster_by_mask(raster_file, mask_layer):
-    with rasterio.open(raster_file) as src:
-        valid_crs = src.crs.to_string()
-        mask_layer = mask_layer.to_crs(valid_crs)
-        out_image, out_transform = mask(src, mask_layer.geometry, crop=True)
-        out_meta = src.meta.copy()
-
-    out_meta.update({
-        "driver": "GTiff",
-        "height": out_image.shape[1],
-        "width": out_image.shape[2],
-        "transform": out_transform
-    })
-
-    clipped_raster_file = str(Path(raster_file).parent / (Path(raster_file).stem + "_clipped.tif"))
-    with rasterio.open(clipped_raster_file, "w", **out_meta) as dest:
-        dest.write(out_image)
-
-    return clipped_raster_file
+# Statewide inputs for the buildable acreage analysis
+DEM_FILE = r"C:\Users\georg\OneDrive\Desktop\RA_pull_files\Ohio\Base maps\DEM\oh_dem_hs\dblbnd.adf"
+WETLANDS_FILE = r"C:\Users\georg\OneDrive\Desktop\RA_pull_files\Ohio\OH Base maps\OH_shapefile_wetlands\Ohio_Wetlands.shp"
+
+# Slope (percent) above which land is not buildable
+MAX_BUILDABLE_SLOPE = 15
+# 'vector' polygonizes the slope raster and overlays it per parcel,
+# 'raster' burns parcels and wetlands onto the slope grid and counts buildable pixels per parcel
+BACRES_ENGINE = 'vector'
+# DEM pixels read beyond the parcels' extent so the 3x3 slope kernel has real neighbours at the edges
+SLOPE_HALO_PIXELS = 1
+# Statewide percent slope precomputed from DEM_FILE with slope_cache.py; used while it is newer than the DEM
+SLOPE_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.bacres_cache', 'OH_slope.tif')
+# Statewide wetlands + steep slope raster built by nonbuildable_mask.py; used while it is newer than its inputs
+NONBUILDABLE_MASK_FILE = os.path.join(os.path.expanduser('~'), '.bacres_cache', 'OH_nonbuildable.tif')
+# Set BACRES_DEBUG_DIR to keep the polygonized steep slope of every run there for inspection
+DEBUG_DIR = os.environ.get('BACRES_DEBUG_DIR')
+
+def clip_raster_by_mask(raster_file, mask_layer, scratch_dir=None):
+    # Windowed read of the DEM around the parcels; the clipped copy is written to the scratch directory
+    return clip_raster_window(raster_file, mask_layer, SLOPE_HALO_PIXELS, scratch_dir)
 
 def calculate_slope(clipped_raster_file):
     slope_file = str(Path(clipped_raster_file).parent / (Path(clipped_raster_file).stem + "_slope.tif"))
@@ -52,15 +60,17 @@ def polygonize_slope(slope_file):
     polygons = list(results)
     slope_gdf = gpd.GeoDataFrame.from_features(polygons, crs=src.crs)
 
-    slope_gdf = slope_gdf[slope_gdf['DN'] > 15]
-    polygonized_slope_file = str(Path(slope_file).parent / (Path(slope_file).stem + "_polygonized.shp"))
-    slope_gdf.to_file(polygonized_slope_file)
+    slope_gdf = slope_gdf[slope_gdf['DN'] > MAX_BUILDABLE_SLOPE]
+    if DEBUG_DIR:
+        os.makedirs(DEBUG_DIR, exist_ok=True)
+        polygonized_slope_base = Path(DEBUG_DIR) / (Path(slope_file).stem + "_polygonized")
+        write_layer(slope_gdf, stage_output_path(polygonized_slope_base, 'slope', default_suffix='.shp'))
 
     return slope_gdf
 
 def calculate_difference(original_vector, slope_gdf, wetlands_file):
-    print("Loading wetlands data...")
-    wetlands_data = gpd.read_file(wetlands_file)
+    print("Loading wetlands data near the parcels...")
+    wetlands_data = read_wetlands_near(wetlands_file, original_vector)
 
     print("Reprojecting datasets to common CRS...")
     original_vector_crs = original_vector.crs.to_string()
@@ -74,76 +84,164 @@ def calculate_difference(original_vector, slope_gdf, wetlands_file):
     print("Combining wetlands and slope data into non-buildable areas...")
     non_buildable_gdf = pd.concat([wetlands_data, slope_gdf], ignore_index=True)
 
-    # Create spatial index for the original vector data and the non-buildable areas
-    original_vector_sindex = original_vector.sindex
-    non_buildable_sindex = non_buildable_gdf.sindex
-
-    print("Calculating the difference between original parcels and non-buildable areas in chunks...")
-    # Process in chunks to avoid memory issues
-    difference_results = []
+    return subtract_non_buildable(original_vector, non_buildable_gdf)
 
-    for index, parcel in original_vector.iterrows():
-        possible_matches_index = list(non_buildable_sindex.intersection(parcel['geometry'].bounds))
-        possible_matches = non_buildable_gdf.iloc[possible_matches_index]
-
-        if not possible_matches.empty:
-            difference = gpd.overlay(gpd.GeoDataFrame([parcel], crs=original_vector.crs), possible_matches,
-                                     how='difference')
-            difference_results.append(difference)
-        else:
-            difference_results.append(gpd.GeoDataFrame([parcel], crs=original_vector.crs))
-
-    difference_gdf = pd.concat(difference_results, ignore_index=True)
+def subtract_non_buildable(original_vector, non_buildable_gdf):
+    print("Calculating the difference between original parcels and non-buildable areas...")
+    # All (parcel, non-buildable) candidate pairs from one bulk spatial index query
+    non_buildable_sindex = non_buildable_gdf.sindex
+    parcel_positions, candidate_positions = non_buildable_sindex.query(original_vector.geometry, predicate='intersects')
+
+    geometries = original_vector.geometry.to_numpy().copy()
+    if len(parcel_positions):
+        # Union the non-buildable pieces touching each parcel, then subtract them from all parcels in one call
+        candidates = gpd.GeoDataFrame({'parcel_position': parcel_positions},
+                                      geometry=non_buildable_gdf.geometry.to_numpy()[candidate_positions],
+                                      crs=original_vector.crs)
+        non_buildable_by_parcel = candidates.dissolve(by='parcel_position').geometry
+        positions = non_buildable_by_parcel.index.to_numpy()
+        geometries[positions] = shapely.difference(geometries[positions], non_buildable_by_parcel.to_numpy())
+
+    # Parcels keep their attributes and index; fully non-buildable parcels drop out as they did with overlay
+    difference_gdf = original_vector.set_geometry(gpd.GeoSeries(geometries, index=original_vector.index,
+                                                                crs=original_vector.crs))
+    difference_gdf = difference_gdf[~difference_gdf.geometry.is_empty]
 
     print("Difference calculation complete.")
     return difference_gdf
 
 def calculate_overlap(difference_gdf, original_vector):
-    overlap_gdf = gpd.overlay(difference_gdf, original_vector, how='intersection')
-    overlap_gdf['overlap_area'] = overlap_gdf.area
-    overlap_gdf['overlap_pc'] = (overlap_gdf['overlap_area'] / original_vector.area) * 100
+    # The difference pieces already lie inside their parcel, so the buildable share is a grouped area
+    # sum keyed on parcel_id; parcels left with no buildable piece get 0
+    buildable_area = difference_gdf.geometry.area.groupby(difference_gdf['parcel_id']).sum()
+    parcel_area = original_vector.geometry.area.groupby(original_vector['parcel_id']).sum()
 
-    return overlap_gdf
+    overlap_pc = buildable_area.reindex(parcel_area.index, fill_value=0) / parcel_area * 100
+    return overlap_pc.rename('overlap_pc').rename_axis('parcel_id').reset_index()
 
 def calculate_bacres(overlap_gdf, original_vector):
-    original_vector['overlap_pc'] = pd.to_numeric(overlap_gdf['overlap_pc'], errors='coerce')
+    # Join the buildable share back onto the parcels by parcel_id rather than by row position
+    overlap_pc = overlap_gdf.set_index('parcel_id')['overlap_pc']
+    original_vector['overlap_pc'] = pd.to_numeric(original_vector['parcel_id'].map(overlap_pc), errors='coerce')
     original_vector['acreage_calc'] = pd.to_numeric(original_vector['acreage_calc'], errors='coerce')
 
-    original_vector['overlap_pc'].fillna(0, inplace=True)
-    original_vector['acreage_calc'].fillna(0, inplace=True)
+    original_vector['overlap_pc'] = original_vector['overlap_pc'].fillna(0)
+    original_vector['acreage_calc'] = original_vector['acreage_calc'].fillna(0)
 
     original_vector['Bacres'] = (original_vector['overlap_pc'] * original_vector['acreage_calc']) / 100
     return original_vector
 
-def run_analysis(vector_file, slope_file, wetlands_file):
-    try:
-        vector_data = gpd.read_file(vector_file, dtype={'parcel_id': str})
+def overlap_percentages(original_vector, total_pixels, buildable_pixels):
+    # Share of each parcel's pixels that are buildable, as a percentage. Rows sharing a parcel_id (a
+    # parcel split into several features) are summed first, one row per parcel like calculate_overlap.
+    pixels = pd.DataFrame({'total': total_pixels, 'buildable': buildable_pixels}) \
+        .groupby(original_vector['parcel_id'].to_numpy()).sum()
+    total, buildable = pixels['total'].to_numpy(), pixels['buildable'].to_numpy()
+    overlap_pc = np.divide(buildable * 100, total, out=np.zeros(len(total)), where=total > 0)
+    return pd.DataFrame({'parcel_id': pixels.index, 'overlap_pc': overlap_pc})
+
+def calculate_zonal_overlap(original_vector, slope_file, wetlands_file):
+    # Pixels that are neither steep nor wetland, counted per parcel on the slope grid
+    wetlands_data = read_wetlands_near(wetlands_file, original_vector)
+    total_pixels, buildable_pixels, _ = zonal_buildable_pixels(
+        original_vector, slope_file, lambda slope: slope > MAX_BUILDABLE_SLOPE, wetlands_data)
+    return overlap_percentages(original_vector, total_pixels, buildable_pixels)
+
+def calculate_mask_overlap(original_vector, mask_file, engine=BACRES_ENGINE, scratch_dir=None):
+    # Buildable share of each parcel from the statewide non-buildable mask, reading only the parcels' window
+    with stage('mask_read'):
+        clipped_mask_file = clip_raster_window(mask_file, original_vector, scratch_dir=scratch_dir)
+    if engine == 'raster':
+        with stage('zonal') as record:
+            total_pixels, buildable_pixels, _ = zonal_buildable_pixels(
+                original_vector, clipped_mask_file, lambda mask: mask == NONBUILDABLE)
+            record['rows'] = len(original_vector)
+        return overlap_percentages(original_vector, total_pixels, buildable_pixels)
+
+    with stage('polygonize') as record:
+        non_buildable_gdf = polygonize_mask(clipped_mask_file).to_crs(original_vector.crs)
+        record['rows'] = len(non_buildable_gdf)
+    with stage('overlay') as record:
+        difference_gdf = subtract_non_buildable(original_vector, non_buildable_gdf)
+        record['rows'] = len(difference_gdf)
+    return calculate_overlap(difference_gdf, original_vector)
+
+def prepare_nonbuildable_mask(regenerate=False):
+    # One-time statewide build: slope cache from the DEM, then steep slope + wetlands into the mask
+    slope_cache_file = ensure_slope_cache(DEM_FILE, SLOPE_CACHE_FILE, regenerate)
+    return ensure_nonbuildable_mask(slope_cache_file, lambda slope: slope > MAX_BUILDABLE_SLOPE, WETLANDS_FILE,
+                                    NONBUILDABLE_MASK_FILE, regenerate)
+
+def calculate_slope_overlap(vector_data, dem_file, wetlands_file, engine=BACRES_ENGINE,
+                            slope_cache_file=SLOPE_CACHE_FILE, scratch_dir=None):
+    # Buildable share of each parcel from the slope under the parcels and the nearby wetlands.
+    # The clipped DEM and its slope are written to scratch_dir.
+    with stage('slope'):
+        if slope_cache_file and slope_cache_is_current(dem_file, slope_cache_file):
+            print("Step 1-2: Reading slope from the statewide slope cache")
+            slope_file = clip_raster_window(slope_cache_file, vector_data, scratch_dir=scratch_dir)
+        else:
+            print("Step 1: Clipping raster by mask layer")
+            clipped_raster_file = clip_raster_by_mask(dem_file, vector_data, scratch_dir)
 
-        print("Step 1: Clipping raster by mask layer")
-        clipped_raster_file = clip_raster_by_mask(slope_file, vector_data)
+            print("Step 2: Calculating slope of clipped raster")
+            slope_file = calculate_slope(clipped_raster_file)
 
-        print("Step 2: Calculating slope of clipped raster")
-        slope_file = calculate_slope(clipped_raster_file)
+    if engine == 'raster':
+        print("Step 3: Counting buildable slope pixels per parcel")
+        with stage('zonal') as record:
+            record['rows'] = len(vector_data)
+            return calculate_zonal_overlap(vector_data, slope_file, wetlands_file)
 
-        print("Step 3: Polygonizing slope raster")
+    print("Step 3: Polygonizing slope raster")
+    with stage('polygonize') as record:
         slope_gdf = polygonize_slope(slope_file)
+        record['rows'] = len(slope_gdf)
 
-        print("Step 5: Calculating difference between wetlands layer and filtered polygonized layer")
+    print("Step 5: Calculating difference between wetlands layer and filtered polygonized layer")
+    with stage('overlay') as record:
         difference_gdf = calculate_difference(vector_data, slope_gdf, wetlands_file)
+        record['rows'] = len(difference_gdf)
+
+    print("Step 6: Summing buildable area per parcel")
+    return calculate_overlap(difference_gdf, vector_data)
+
+def compute_bacres(vector_data, slope_file=DEM_FILE, wetlands_file=WETLANDS_FILE, engine=BACRES_ENGINE,
+                   slope_cache_file=SLOPE_CACHE_FILE, nonbuildable_mask_file=NONBUILDABLE_MASK_FILE):
+    # Intermediate rasters and polygons only live as long as this run
+    with scratch_run_dir() as scratch_dir:
+        if nonbuildable_mask_file and mask_is_current(nonbuildable_mask_file, slope_file, wetlands_file):
+            print("Step 1-6: Reading non-buildable areas from the statewide mask")
+            overlap_gdf = calculate_mask_overlap(vector_data, nonbuildable_mask_file, engine, scratch_dir)
+        else:
+            overlap_gdf = calculate_slope_overlap(vector_data, slope_file, wetlands_file, engine, slope_cache_file,
+                                                  scratch_dir)
 
-        print("Step 6: Calculating overlap of difference layer and original _2m layer")
-        overlap_gdf = calculate_overlap(difference_gdf, vector_data)
-
-        print("Step 7: Calculating Bacres")
+    print("Step 7: Calculating Bacres")
+    with stage('bacres_sum') as record:
         final_gdf = calculate_bacres(overlap_gdf, vector_data)
+        record['rows'] = len(final_gdf)
+
+    # Ensure parcel_id remains a string
+    final_gdf['parcel_id'] = final_gdf['parcel_id'].astype(str)
+    return final_gdf
+
+def run_analysis(vector_file, slope_file, wetlands_file):
+    try:
+        vector_data = read_layer(vector_file)
+        vector_data['parcel_id'] = vector_data['parcel_id'].astype(str)
+        final_gdf = compute_bacres(vector_data, slope_file, wetlands_file)
 
-        # Ensure parcel_id remains a string
-        final_gdf['parcel_id'] = final_gdf['parcel_id'].astype(str)
+        base = Path(vector_file).parent / (Path(vector_file).stem + "_buildable_acres")
+        if stage_format('bacres') == 'parquet':
+            # One GeoParquet file serves as both the layer and the table the scoring script reads
+            output_file = write_layer(final_gdf, f"{base}.parquet")
+            print(f"Buildable acres calculated and saved to: {output_file}")
+            return output_file
 
-        output_file = str(Path(vector_file).parent / (Path(vector_file).stem + "_buildable_acres.gpkg"))
-        final_gdf.to_file(output_file, driver="GPKG")
+        output_file = write_layer(final_gdf, f"{base}.gpkg")
 
-        csv_output_file = str(Path(vector_file).parent / (Path(vector_file).stem + "_buildable_acres.csv"))
+        csv_output_file = f"{base}.csv"
         final_gdf.to_csv(csv_output_file, index=False)
 
         print(f"Buildable acres calculated and saved to: {output_file}")
@@ -156,8 +254,8 @@ def run_analysis(vector_file, slope_file, wetlands_file):
         return None
 
 def main():
-    slope_file = r"C:\Users\georg\OneDrive\Desktop\RA_pull_files\Ohio\Base maps\DEM\oh_dem_hs\dblbnd.adf"
-    wetlands_file = r"C:\Users\georg\OneDrive\Desktop\RA_pull_files\Ohio\OH Base maps\OH_shapefile_wetlands\Ohio_Wetlands.shp"
+    slope_file = DEM_FILE
+    wetlands_file = WETLANDS_FILE
 
     if len(sys.argv) == 2:
         vector_file = sys.argv[1]
@@ -165,7 +263,8 @@ def main():
         root = tk.Tk()
         root.withdraw()
         vector_file = filedialog.askopenfilename(title="Select the vector file",
-                                                 filetypes=[("GeoPackage files", "*.gpkg"), ("Shapefiles", "*.shp")])
+                                                 filetypes=[("GeoPackage files", "*.gpkg"), ("Shapefiles", "*.shp"),
+                                                           ("GeoParquet files", "*.parquet")])
         if not vector_file:
             print("No vector file selected. Exiting.")
             sys.exit(1)
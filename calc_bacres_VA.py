@@ -1,42 +1,37 @@
 import geopandas as gpd
 import rasterio
-from rasterio.mask import mask
 from rasterio.features import shapes
 from shapely.geometry import shape, box
 import numpy as np
 import pandas as pd
+import shapely
 from pathlib import Path
 import sys
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import subprocess
 import os
+from bacres_raster import (zonal_buildable_pixels, read_wetlands_near, clip_raster_window, scratch_run_dir,
+                           SQ_METERS_PER_ACRE)
+from nonbuildable_mask import mask_is_current, ensure_nonbuildable_mask, polygonize_mask, NONBUILDABLE
+from instrumentation import stage
+from stage_io import read_layer, write_layer, stage_format
 
+# Statewide inputs for the buildable acreage analysis
+SLOPE_FILE = r"C:\Users\georg\OneDrive\Documents\GIS projects\Elevation models\VA15percRaster\SlopeReclass.tif"
+WETLANDS_FILE = r"C:\Users\georg\OneDrive\Documents\GIS projects\Elevation models\VA15percRaster\Fixed VA wetlands.shp"
 
-def clip_raster_by_extent(slope_file, vector_data):
-    # Calculate the extent of the vector file
-    bounds = vector_data.total_bounds
-    extent = box(bounds[0], bounds[1], bounds[2], bounds[3])
+# Value of the reclassified slope raster that marks unbuildable (steep) land
+NONBUILDABLE_SLOPE_CLASS = 0
+# 'vector' polygonizes the slope raster and overlays it per parcel,
+# 'raster' burns parcels and wetlands onto the slope grid and counts buildable pixels per parcel
+BACRES_ENGINE = 'vector'
+# Statewide wetlands + steep slope raster built by nonbuildable_mask.py; used while it is newer than its inputs
+NONBUILDABLE_MASK_FILE = os.path.join(os.path.expanduser('~'), '.bacres_cache', 'VA_nonbuildable.tif')
 
-    # Clip the slope raster file to the extent of the vector file
-    with rasterio.open(slope_file) as src:
-        out_image, out_transform = mask(src, [extent], crop=True)
-        out_meta = src.meta.copy()
-
-    # Update the metadata to reflect the new clipped area
-    out_meta.update({
-        "driver": "GTiff",
-        "height": out_image.shape[1],
-        "width": out_image.shape[2],
-        "transform": out_transform
-    })
-
-    # Save the clipped raster to a temporary file
-    clipped_slope_file = str(Path(slope_file).parent / (Path(slope_file).stem + "_clipped.tif"))
-    with rasterio.open(clipped_slope_file, "w", **out_meta) as dest:
-        dest.write(out_image)
-
-    return clipped_slope_file
+def clip_raster_by_extent(slope_file, vector_data, scratch_dir=None):
+    # Read only the window of the slope raster under the vector file's extent into the scratch directory
+    return clip_raster_window(slope_file, vector_data, scratch_dir=scratch_dir)
 
 
 def polygonize_raster(clipped_slope_file):
@@ -56,7 +51,7 @@ def polygonize_raster(clipped_slope_file):
     gdf = gpd.GeoDataFrame.from_features(polygons)
 
     # Filter by DN=0
-    gdf = gdf[gdf['DN'] == 0]
+    gdf = gdf[gdf['DN'] == NONBUILDABLE_SLOPE_CLASS]
 
     return gdf
 
@@ -74,55 +69,104 @@ def calculate_buildable_acres(slope_file, wetlands_file, vector_file):
         return None, None
 
     # Load the vector file
-    vector_data = gpd.read_file(vector_file)
+    vector_data = read_layer(vector_file)
+    vector_data = compute_bacres(vector_data, slope_file, wetlands_file)
 
-    # Ensure the vector data is in the same CRS as the slope raster
-    with rasterio.open(slope_file) as src:
-        raster_crs = src.crs
-        vector_data = vector_data.to_crs(raster_crs)
-
-    # Clip the slope raster by the extent of the vector file
-    clipped_slope_file = clip_raster_by_extent(slope_file, vector_data)
+    base = Path(vector_file).parent / (Path(vector_file).stem + "_buildable_acres")
+    if stage_format('bacres') == 'parquet':
+        # One GeoParquet file serves as both the layer and the table clean_csv scores
+        output_file = write_layer(vector_data, f"{base}.parquet")
+        return output_file, output_file
 
-    # Polygonize the clipped slope raster and filter by DN=0
-    slope_gdf = polygonize_raster(clipped_slope_file)
-
-    # Load the wetlands file
-    wetlands_data = gpd.read_file(wetlands_file)
-    wetlands_data = wetlands_data.to_crs(raster_crs)
+    # Save the updated vector layer to a new file
+    output_file = write_layer(vector_data, f"{base}.gpkg")
 
-    # Perform a difference operation to exclude wetlands and slope DN=0 areas
-    non_buildable_gdf = gpd.GeoDataFrame(pd.concat([wetlands_data, slope_gdf], ignore_index=True))
-    buildable_gdf = gpd.overlay(vector_data, non_buildable_gdf, how='difference')
+    # Save the updated vector layer to a new CSV file
+    csv_output_file = f"{base}.csv"
+    vector_data.to_csv(csv_output_file, index=False)
 
-    # Calculate the buildable area for each parcel
-    buildable_acres = []
-    for idx, row in vector_data.iterrows():
-        geom = row['geometry']
-        buildable_geom = buildable_gdf.intersection(geom)
-        buildable_area = buildable_geom.area.sum()
-        buildable_acres.append(buildable_area / 4046.86)  # Convert square meters to acres
+    return output_file, csv_output_file
 
-    # Convert 'acreage_calc' field to numeric type if necessary
-    vector_data['acreage_calc'] = pd.to_numeric(vector_data['acreage_calc'], errors='coerce')
 
-    # Add a new field to the vector layer for buildable acres
-    vector_data['Bacres'] = (np.array(buildable_acres)).astype(int)
+def prepare_nonbuildable_mask(regenerate=False):
+    # One-time statewide build of the steep slope + wetlands mask on the slope raster's grid
+    return ensure_nonbuildable_mask(SLOPE_FILE, lambda slope: slope == NONBUILDABLE_SLOPE_CLASS, WETLANDS_FILE,
+                                    NONBUILDABLE_MASK_FILE, regenerate)
 
-    # Save the updated vector layer to a new file
-    output_file = str(Path(vector_file).parent / (Path(vector_file).stem + "_buildable_acres.gpkg"))
-    vector_data.to_file(output_file, driver="GPKG")
 
-    # Save the updated vector layer to a new CSV file
-    csv_output_file = str(Path(vector_file).parent / (Path(vector_file).stem + "_buildable_acres.csv"))
-    vector_data.to_csv(csv_output_file, index=False)
+def compute_bacres(vector_data, slope_file=SLOPE_FILE, wetlands_file=WETLANDS_FILE, engine=BACRES_ENGINE,
+                   nonbuildable_mask_file=NONBUILDABLE_MASK_FILE):
+    # Ensure the vector data is in the same CRS as the slope raster
+    with rasterio.open(slope_file) as src:
+        raster_crs = src.crs
+        vector_data = vector_data.to_crs(raster_crs)
 
-    return output_file, csv_output_file
+    # Clipped rasters only live as long as this run
+    with scratch_run_dir() as scratch_dir:
+        # With a current statewide mask, wetlands and steep slope come from one windowed read of it
+        use_mask = bool(nonbuildable_mask_file) and mask_is_current(nonbuildable_mask_file, slope_file, wetlands_file)
+        with stage('mask_read' if use_mask else 'slope'):
+            if use_mask:
+                clipped_mask_file = clip_raster_window(nonbuildable_mask_file, vector_data, scratch_dir=scratch_dir)
+            else:
+                # Clip the slope raster by the extent of the vector file
+                clipped_slope_file = clip_raster_by_extent(slope_file, vector_data, scratch_dir)
+
+        if engine == 'raster':
+            # Count the buildable pixels in each parcel without polygonizing the raster
+            with stage('zonal') as record:
+                if use_mask:
+                    _, buildable_pixels, pixel_area = zonal_buildable_pixels(
+                        vector_data, clipped_mask_file, lambda mask: mask == NONBUILDABLE)
+                else:
+                    wetlands_data = read_wetlands_near(wetlands_file, vector_data)
+                    _, buildable_pixels, pixel_area = zonal_buildable_pixels(
+                        vector_data, clipped_slope_file, lambda slope: slope == NONBUILDABLE_SLOPE_CLASS, wetlands_data)
+                record['rows'] = len(vector_data)
+
+            vector_data['acreage_calc'] = pd.to_numeric(vector_data['acreage_calc'], errors='coerce')
+            vector_data['Bacres'] = (buildable_pixels * pixel_area / SQ_METERS_PER_ACRE).astype(int)
+            return vector_data
+
+        with stage('polygonize') as record:
+            if use_mask:
+                non_buildable_gdf = polygonize_mask(clipped_mask_file)
+            else:
+                # Polygonize the clipped slope raster and filter by DN=0
+                slope_gdf = polygonize_raster(clipped_slope_file)
+
+                # Load the wetlands near the parcels
+                wetlands_data = read_wetlands_near(wetlands_file, vector_data)
+                wetlands_data = wetlands_data.to_crs(raster_crs)
+                non_buildable_gdf = gpd.GeoDataFrame(pd.concat([wetlands_data, slope_gdf], ignore_index=True))
+            record['rows'] = len(non_buildable_gdf)
+
+        # Perform a difference operation to exclude wetlands and slope DN=0 areas
+        with stage('overlay') as record:
+            buildable_gdf = gpd.overlay(vector_data, non_buildable_gdf, how='difference')
+            record['rows'] = len(buildable_gdf)
+
+        # Calculate the buildable area for each parcel: every parcel is intersected only with the buildable
+        # pieces the spatial index matches, in one bulk call, and the areas are summed per parcel
+        with stage('bacres_sum') as record:
+            parcel_positions, piece_positions = buildable_gdf.sindex.query(vector_data.geometry, predicate='intersects')
+            piece_areas = shapely.area(shapely.intersection(vector_data.geometry.to_numpy()[parcel_positions],
+                                                            buildable_gdf.geometry.to_numpy()[piece_positions]))
+            buildable_area = np.bincount(parcel_positions, weights=piece_areas, minlength=len(vector_data))
+            buildable_acres = buildable_area / SQ_METERS_PER_ACRE  # Convert square meters to acres
+            record['rows'] = len(vector_data)
+
+        # Convert 'acreage_calc' field to numeric type if necessary
+        vector_data['acreage_calc'] = pd.to_numeric(vector_data['acreage_calc'], errors='coerce')
+
+        # Add a new field to the vector layer for buildable acres
+        vector_data['Bacres'] = buildable_acres.astype(int)
+        return vector_data
 
 
 def main():
-    slope_file = r"C:\Users\georg\OneDrive\Documents\GIS projects\Elevation models\VA15percRaster\SlopeReclass.tif"
-    wetlands_file = r"C:\Users\georg\OneDrive\Documents\GIS projects\Elevation models\VA15percRaster\Fixed VA wetlands.shp"
+    slope_file = SLOPE_FILE
+    wetlands_file = WETLANDS_FILE
 
     if len(sys.argv) == 2:
         vector_file = sys.argv[1]
@@ -130,7 +174,8 @@ def main():
         root = tk.Tk()
         root.withdraw()
         vector_file = filedialog.askopenfilename(title="Select the vector file",
-                                                 filetypes=[("GeoPackage files", "*.gpkg"), ("Shapefiles", "*.shp")])
+                                                 filetypes=[("GeoPackage files", "*.gpkg"), ("Shapefiles", "*.shp"),
+                                                           ("GeoParquet files", "*.parquet")])
         if not vector_file:
             print("No vector file selected. Exiting.")
             sys.exit(1)
@@ -138,7 +183,7 @@ def main():
     output_file, csv_output_file = calculate_buildable_acres(slope_file, wetlands_file, vector_file)
     if output_file:
         print(f"Buildable acres calculated and saved to: {output_file}")
-        print(f"CSV file saved to: {csv_output_file}")
+        print(f"Table for scoring saved to: {csv_output_file}")
 
         root = tk.Tk()
         root.withdraw()
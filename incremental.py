@@ -0,0 +1,137 @@
+import json
+import os
+
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from tx_proximity import get_utm_crs, drop_tax_exempt, proximity_columns
+
+# Fetched attributes the expensive stages depend on; together with the geometry they decide whether
+# a parcel's results from the previous run can be reused
+HASHED_COLUMNS = ['acreage_calc', 'land_use_class']
+# Results carried over from the previous run for unchanged parcels (by default; multi-query
+# proximity runs pass their own columns)
+PROXIMITY_COLUMNS = proximity_columns()
+BACRES_COLUMNS = ['overlap_pc', 'Bacres']
+STATE_SUFFIX = '_parcel_state.parquet'
+# Column recording the proximity settings the state's results were measured with
+SETTINGS_COLUMN = 'proximity_settings'
+
+
+def parcel_hashes(parcels):
+    # One 64-bit hash per parcel over its geometry and HASHED_COLUMNS, indexed like parcels
+    columns = {'geometry': shapely.to_wkb(parcels.geometry.to_numpy(), hex=True)}
+    for col in HASHED_COLUMNS:
+        if col in parcels.columns:
+            columns[col] = parcels[col].astype(str).to_numpy()
+    return pd.util.hash_pandas_object(pd.DataFrame(columns, index=parcels.index), index=False)
+
+
+def proximity_settings(max_distance_miles=None):
+    # Settings the reused distances depend on, as stored in the state file
+    return json.dumps({'max_distance_miles': max_distance_miles})
+
+
+def load_state(state_file, columns=PROXIMITY_COLUMNS, max_distance_miles=None):
+    # None when there is no state, it lacks proximity columns this run needs, or its results were
+    # measured with other proximity settings (a parcel beyond the old radius has no distance to reuse)
+    if not os.path.isfile(state_file):
+        return None
+    state = pd.read_parquet(state_file).drop_duplicates(subset='parcel_id')
+    if not set(columns) <= set(state.columns):
+        print(f"Ignoring {state_file}: it was saved without {', '.join(sorted(set(columns) - set(state.columns)))}")
+        return None
+    settings = proximity_settings(max_distance_miles)
+    if SETTINGS_COLUMN not in state.columns or not (state[SETTINGS_COLUMN] == settings).all():
+        print(f"Ignoring {state_file}: it was saved with other proximity settings than {settings}")
+        return None
+    return state
+
+
+def save_state(state_file, fetched, hashes, measured=None, bacres=None, columns=PROXIMITY_COLUMNS,
+               max_distance_miles=None):
+    # Hash of every fetched parcel plus this run's results, read back by the next incremental run.
+    # Parcels the proximity stage dropped (tax exempt) are kept with empty results so they count as unchanged.
+    state = pd.DataFrame({
+        'parcel_id': fetched['parcel_id'].astype(str).to_numpy(),
+        'parcel_hash': hashes.loc[fetched.index].to_numpy(),
+        SETTINGS_COLUMN: proximity_settings(max_distance_miles),
+    })
+    if measured is not None:
+        for col in columns:
+            values = measured[col].reindex(fetched.index)
+            if col.startswith('voltage_'):
+                state[col] = pd.array(list(values.where(values.notna(), None)), dtype='Int64')
+            else:
+                state[col] = pd.to_numeric(values, errors='coerce').to_numpy()
+    if bacres is not None:
+        for col in BACRES_COLUMNS:
+            if col in bacres.columns:
+                values = pd.to_numeric(bacres[col], errors='coerce')
+                # Whole-acre Bacres (VA) is kept as integers, so reused parcels are written as 2 and not 2.0
+                if pd.api.types.is_integer_dtype(values):
+                    values = values.astype('Int64')
+                state[col] = values.reindex(fetched.index).array
+    state.to_parquet(state_file, index=False)
+
+
+def unchanged_mask(parcels, hashes, state):
+    # True for parcels whose parcel_id and hash both match a parcel of the previous run
+    keys = pd.DataFrame({'parcel_id': parcels['parcel_id'].astype(str).to_numpy(), 'parcel_hash': hashes.to_numpy()})
+    matched = keys.merge(state[['parcel_id', 'parcel_hash']], how='left', indicator=True)
+    return pd.Series((matched['_merge'] == 'both').to_numpy(), index=parcels.index)
+
+
+def previous_values(parcels, state, column):
+    values = parcels['parcel_id'].astype(str).map(state.set_index('parcel_id')[column])
+    if column.startswith('voltage_'):
+        # Plain ints (None when unmatched), as the proximity stage produces them
+        return values.astype(object).where(values.notna(), None)
+    return values
+
+
+def reuse_proximity(unchanged_parcels, measured, state, columns=PROXIMITY_COLUMNS):
+    # Combine freshly measured parcels with unchanged ones that take their distance and voltage from
+    # the previous run, filtered and projected like the proximity stage does, in fetch order
+    unchanged_parcels = drop_tax_exempt(unchanged_parcels)
+    if unchanged_parcels.empty:
+        return measured
+
+    crs = measured.crs if measured is not None else get_utm_crs(unchanged_parcels.unary_union)
+    reused = unchanged_parcels.to_crs(crs)
+    for col in columns:
+        reused[col] = previous_values(reused, state, col)
+    if measured is None:
+        return reused
+    return gpd.GeoDataFrame(pd.concat([measured, reused]).sort_index(), crs=crs)
+
+
+def reusable_bacres(subset, unchanged, state):
+    # Subset parcels that are unchanged and already had buildable acres computed last time
+    if 'Bacres' not in state.columns:
+        return pd.Series(False, index=subset.index)
+    return unchanged.reindex(subset.index, fill_value=False) & previous_values(subset, state, 'Bacres').notna()
+
+
+def reuse_bacres(reused_subset, computed, state):
+    # Give unchanged subset parcels their previous buildable acres and shape them like compute_bacres
+    # output (CRS, dtypes, columns) before combining them with the freshly computed parcels.
+    # When nothing was recomputed the reused parcels keep the proximity stage's CRS.
+    if reused_subset.empty:
+        return computed
+
+    reused = reused_subset.copy()
+    reused['acreage_calc'] = pd.to_numeric(reused['acreage_calc'], errors='coerce')
+    for col in BACRES_COLUMNS:
+        if col in state.columns and state[col].notna().any():
+            reused[col] = previous_values(reused, state, col)
+    if computed is None:
+        return reused
+
+    reused = reused.to_crs(computed.crs)
+    for col in ['parcel_id'] + BACRES_COLUMNS:
+        if col in reused.columns and col in computed.columns:
+            reused[col] = reused[col].astype(computed[col].dtype)
+    combined = pd.concat([computed, reused]).sort_index()
+    return gpd.GeoDataFrame(combined[list(computed.columns)], crs=computed.crs)
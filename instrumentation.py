@@ -0,0 +1,164 @@
+import contextvars
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# psutil gives I/O counters (and peak memory on Windows); without it only time and, on Unix, peak RSS are recorded
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+MB = 1024 * 1024
+
+# Report that stage() records into when none is passed explicitly (set with active_report)
+_active_report = contextvars.ContextVar('active_report', default=None)
+# Peak trackers of the stages currently open in this context, outermost first
+_open_stages = contextvars.ContextVar('open_stages', default=())
+_progress_subscribers = []
+_subscribers_lock = threading.Lock()
+
+
+def peak_rss_bytes():
+    # High-water mark of the process's resident memory so far
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        if hasattr(memory, 'peak_wset'):  # Windows
+            return memory.peak_wset
+    if sys.platform.startswith('linux'):
+        # VmHWM belongs to this process image; ru_maxrss also carries the peak of the parent it was exec'd from
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    return None
+
+
+def reset_peak_rss():
+    # Restart the high-water mark from the current RSS so the next reading covers only what follows.
+    # Only Linux can do this (clear_refs, kernel 4.0+); returns False where the peak cannot be reset.
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def io_bytes():
+    # (read_bytes, write_bytes) of the whole process, or (None, None) where the platform has no counters
+    if psutil is None:
+        return None, None
+    try:
+        counters = psutil.Process().io_counters()
+    except (AttributeError, psutil.Error):
+        return None, None
+    return counters.read_bytes, counters.write_bytes
+
+
+def new_report(**fields):
+    return {**fields, 'started': time.strftime('%Y-%m-%d %H:%M:%S'), 'stages': {}}
+
+
+@contextmanager
+def active_report(report):
+    # Stages run inside this block (including those deep inside library code) are recorded in report
+    token = _active_report.set(report)
+    try:
+        yield report
+    finally:
+        _active_report.reset(token)
+
+
+def merge_stage(previous, record):
+    # A stage that runs more than once in a report (e.g. per chunk) accumulates into one record
+    merged = dict(previous)
+    for key in ('rows', 'wall_seconds', 'cpu_seconds', 'read_mb', 'write_mb'):
+        if previous.get(key) is not None and record.get(key) is not None:
+            merged[key] = round(previous[key] + record[key], 3)
+    if record.get('peak_rss_mb') is not None:
+        merged['peak_rss_mb'] = max(previous.get('peak_rss_mb') or 0, record['peak_rss_mb'])
+    merged['calls'] = previous.get('calls', 1) + 1
+    return merged
+
+
+@contextmanager
+def stage(name, report=None):
+    # Measure a block of work: wall and CPU time, its peak RSS and the bytes it read and wrote.
+    # Set record['rows'] inside the block to record how many rows it produced.
+    # The record is added to report (or the active report) and logged.
+    # On Linux the high-water mark is reset when a stage starts, so peak_rss_mb is the peak during the
+    # stage; enclosing stages keep the peak reached before a nested stage reset it. Elsewhere the mark
+    # cannot be reset and peak_rss_mb is the process's peak so far.
+    report = report if report is not None else _active_report.get()
+    record = {'rows': None}
+    open_stages = _open_stages.get()
+    peak_before = peak_rss_bytes()
+    for tracker in open_stages:
+        tracker['peak'] = max(tracker['peak'], peak_before or 0)
+    tracker = {'peak': 0 if reset_peak_rss() else peak_before or 0}
+    token = _open_stages.set(open_stages + (tracker,))
+    read_before, write_before = io_bytes()
+    wall_before, cpu_before = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        _open_stages.reset(token)
+        read_after, write_after = io_bytes()
+        peak_rss = peak_rss_bytes()
+        if peak_rss is not None:
+            peak_rss = max(peak_rss, tracker['peak'])
+        record.update({
+            'wall_seconds': round(time.perf_counter() - wall_before, 3),
+            'cpu_seconds': round(time.process_time() - cpu_before, 3),
+            'peak_rss_mb': None if peak_rss is None else round(peak_rss / MB, 1),
+            'read_mb': None if read_after is None else round((read_after - read_before) / MB, 3),
+            'write_mb': None if write_after is None else round((write_after - write_before) / MB, 3),
+        })
+        logging.info(f"stage {name}: {record}")
+        if report is not None:
+            stages = report['stages']
+            stages[name] = merge_stage(stages[name], record) if name in stages else record
+
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    return path
+
+
+def subscribe_progress(callback):
+    # callback(stage, done, total) is called from whichever thread does the work; GUIs should hand
+    # the update to their own event loop (e.g. root.after) before touching widgets
+    with _subscribers_lock:
+        _progress_subscribers.append(callback)
+    return callback
+
+
+def unsubscribe_progress(callback):
+    with _subscribers_lock:
+        if callback in _progress_subscribers:
+            _progress_subscribers.remove(callback)
+
+
+def emit_progress(stage_name, done, total):
+    with _subscribers_lock:
+        subscribers = list(_progress_subscribers)
+    for callback in subscribers:
+        try:
+            callback(stage_name, done, total)
+        except Exception as e:
+            logging.error(f"progress subscriber failed: {e}")
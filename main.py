@@ -1,27 +1,25 @@
 import sys
 import requests
-import geopandas as gpd
-from shapely import wkt
 from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QVBoxLayout, QLineEdit, QMessageBox, QFileDialog
 import os
 import logging
 import subprocess
+from reportall_client import iter_pages, PageCache, build_query_params, state_for_county, api_url
+from parcel_ingest import results_to_geodataframe, stream_pages_to_gpkg
+from stage_io import read_layer, write_layer
 
 # Setup logging for debugging purposes
 logging.basicConfig(level=logging.DEBUG, filename='debug.log', filemode='w',
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-# API and authentication details
-client_key = 'RqMXhNFKlQ'  # Replace with your actual client token
-api_version = '9'  # API version
-api_url = "https://reportallusa.com/api/parcels"
+# On-disk cache of raw API pages; set REPORTALL_OFFLINE=1 to replay cached counties without network access
+cache_dir = os.path.join(os.path.expanduser('~'), '.reportall_cache')
+page_cache = PageCache(cache_dir, offline=os.environ.get('REPORTALL_OFFLINE') == '1')
 
-# Mapping of County_ID prefixes to states
-STATE_MAPPING = {
-    '39': 'OH',  # Ohio
-    '51': 'VA',  # Virginia
-    # Add more states here as needed
-}
+# Ask for the save location before querying and append each page to the GeoPackage as it arrives,
+# keeping memory to about one page and leaving a partial file behind if a later page fails;
+# set REPORTALL_STREAM_TO_GPKG=1 to turn it on
+stream_to_gpkg = os.environ.get('REPORTALL_STREAM_TO_GPKG') == '1'
 
 class ReportAllParcelSearch(QWidget):
     def __init__(self):
@@ -79,38 +77,19 @@ class ReportAllParcelSearch(QWidget):
         self.run_new_query(county_id, owner, parcel_id, calc_acreage_min)
 
     def run_new_query(self, county_id, owner, parcel_id, calc_acreage_min):
-        params = {
-            'client': client_key,
-            'v': api_version,
-            'county_id': county_id,
-            'owner': owner,
-            'parcel_id': parcel_id,
-            'calc_acreage_min': calc_acreage_min,
-            'returnGeometry': 'true',
-            'f': 'geojson',
-            'page': 1
-        }
+        params = build_query_params(county_id, owner, parcel_id, calc_acreage_min)
+        if stream_to_gpkg:
+            self.run_streaming_query(params)
+            return
+
         all_results = []
         try:
-            while True:
-                response = requests.get(api_url, params=params)
-                response.raise_for_status()
-                data = response.json()
-
-                if 'results' in data and data['results']:
-                    all_results.extend(data['results'])
-                    if data['count'] > len(all_results):
-                        params['page'] += 1
-                        continue
-                    else:
-                        break
-                else:
-                    break
+            # Pages after the first are fetched concurrently over one pooled session
+            for page_results in iter_pages(api_url, params, cache=page_cache):
+                all_results.extend(page_results)
 
             if all_results:
-                geometries = [wkt.loads(res['geom_as_wkt']) for res in all_results if 'geom_as_wkt' in res]
-                gdf = gpd.GeoDataFrame(all_results, geometry=geometries)
-                gdf.crs = "EPSG:4326"
+                gdf = results_to_geodataframe(all_results)
                 self.display_results(gdf)
             else:
                 QMessageBox.warning(self, 'No Results', 'No parcels found for the specified query.')
@@ -118,18 +97,48 @@ class ReportAllParcelSearch(QWidget):
             QMessageBox.critical(self, 'Error', f'Error querying the API: {str(e)}')
             logging.error(f'Error querying the API with URL: {api_url}, params: {params}, error: {str(e)}')
 
+    def run_streaming_query(self, params):
+        self.close()  # Close the initial dialog before showing the "Save As" dialog
+        save_path = self.ask_save_path()
+        if not save_path:
+            QMessageBox.information(self, 'Cancelled', 'Save operation cancelled.')
+            self.close_application()
+            return
+
+        try:
+            record_count = stream_pages_to_gpkg(iter_pages(api_url, params, cache=page_cache), save_path)
+        except requests.exceptions.RequestException as e:
+            QMessageBox.critical(self, 'Error', f'Error querying the API: {str(e)}\n\n'
+                                                f'Pages received before the error were saved to {save_path}')
+            logging.error(f'Error querying the API with URL: {api_url}, params: {params}, error: {str(e)}')
+            self.close_application()
+            return
+
+        if record_count == 0:
+            QMessageBox.warning(self, 'No Results', 'No parcels found for the specified query.')
+            self.close_application()
+            return
+
+        QMessageBox.information(self, 'Success', f'GeoPackage saved to {save_path}')
+        # Only the county_id of the first record is needed to pick the state scripts
+        self.ask_for_proximity_analysis(save_path, read_layer(save_path, rows=1))
+
+    def ask_save_path(self):
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        desktop_path = os.path.join(os.path.expanduser('~'), 'Desktop')
+        save_path, _ = QFileDialog.getSaveFileName(self, "Save GeoPackage", desktop_path,
+                                                   "GeoPackage Files (*.gpkg);;All Files (*)", options=options)
+        if save_path and not save_path.endswith('.gpkg'):
+            save_path += '.gpkg'
+        return save_path
+
     def display_results(self, gdf):
         if not gdf.empty:
             self.close()  # Close the initial dialog before showing the "Save As" dialog
-            options = QFileDialog.Options()
-            options |= QFileDialog.DontUseNativeDialog
-            desktop_path = os.path.join(os.path.expanduser('~'), 'Desktop')
-            save_path, _ = QFileDialog.getSaveFileName(self, "Save GeoPackage", desktop_path,
-                                                       "GeoPackage Files (*.gpkg);;All Files (*)", options=options)
+            save_path = self.ask_save_path()
             if save_path:
-                if not save_path.endswith('.gpkg'):
-                    save_path += '.gpkg'
-                gdf.to_file(save_path, driver='GPKG')
+                write_layer(gdf, save_path)
                 QMessageBox.information(self, 'Success', f'GeoPackage saved to {save_path}')
                 self.ask_for_proximity_analysis(save_path, gdf)
             else:
@@ -152,13 +161,7 @@ class ReportAllParcelSearch(QWidget):
         if 'county_id' not in gdf.columns:
             raise ValueError("The input data does not contain a 'county_id' field.")
 
-        county_id_prefix = gdf['county_id'].astype(str).str[:2].iloc[0]
-        state_code = STATE_MAPPING.get(county_id_prefix)
-
-        if state_code is None:
-            raise ValueError(f"Unrecognized County_ID prefix: {county_id_prefix}. Please update the state mapping.")
-
-        return state_code
+        return state_for_county(gdf['county_id'].astype(str).iloc[0])
 
     def run_proximity_analysis(self, save_path, gdf):
         try:
@@ -0,0 +1,98 @@
+import importlib
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import geopandas as gpd
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.features import rasterize, shapes
+from rasterio.windows import Window, bounds as window_bounds
+from shapely.geometry import box, shape
+
+from stage_io import read_layer
+
+# Mask pixel value for land that is wetland or too steep to build on
+NONBUILDABLE = 1
+# Side length (in pixels) of the blocks the mask is built in
+TILE_SIZE_PIXELS = 4096
+OVERVIEW_LEVELS = [2, 4, 8, 16, 32]
+
+
+def mask_is_current(mask_file, *source_files):
+    # The mask is stale once any of the rasters or shapefiles it was built from has changed
+    return Path(mask_file).is_file() and all(os.path.getmtime(mask_file) >= os.path.getmtime(source)
+                                             for source in source_files)
+
+
+def build_nonbuildable_mask(slope_file, is_nonbuildable, wetlands_file, mask_file, tile_size=TILE_SIZE_PIXELS):
+    # One-time build of a statewide uint8 raster on the slope grid: NONBUILDABLE where the slope is
+    # unbuildable (is_nonbuildable maps slope values to a boolean array) or a wetland covers the pixel.
+    # The state wetlands are read and reprojected once here instead of on every county run.
+    mask_file = Path(mask_file)
+    mask_file.parent.mkdir(parents=True, exist_ok=True)
+    partial_file = str(mask_file) + ".partial.tif"
+
+    with rasterio.open(slope_file) as src:
+        print("Loading wetlands...")
+        wetlands = read_layer(wetlands_file).to_crs(src.crs)
+        wetlands = wetlands[~(wetlands.geometry.isna() | wetlands.geometry.is_empty)]
+        wetlands_sindex = wetlands.sindex
+
+        profile = src.profile.copy()
+        profile.update(driver='GTiff', dtype='uint8', count=1, nodata=None, tiled=True, blockxsize=512,
+                       blockysize=512, compress='deflate', BIGTIFF='IF_SAFER')
+
+        windows = [Window(col_off, row_off, min(tile_size, src.width - col_off), min(tile_size, src.height - row_off))
+                   for row_off in range(0, src.height, tile_size) for col_off in range(0, src.width, tile_size)]
+
+        print(f"Building non-buildable mask in {len(windows)} blocks...")
+        with rasterio.open(partial_file, 'w', **profile) as dst:
+            for done, window in enumerate(windows, start=1):
+                slope = src.read(1, window=window)
+                nonbuildable = np.asarray(is_nonbuildable(slope), dtype=bool)
+
+                # Only the wetlands overlapping this block are burned into it
+                hits = wetlands_sindex.query(box(*window_bounds(window, src.transform)))
+                if len(hits):
+                    wetland_shapes = ((geom, 1) for geom in wetlands.geometry.iloc[hits])
+                    nonbuildable |= rasterize(wetland_shapes, out_shape=slope.shape,
+                                              transform=src.window_transform(window), fill=0,
+                                              dtype='uint8').astype(bool)
+
+                dst.write(np.where(nonbuildable, NONBUILDABLE, 0).astype('uint8'), 1, window=window)
+                print(f"  {done}/{len(windows)} blocks")
+
+            dst.build_overviews(OVERVIEW_LEVELS, Resampling.nearest)
+
+    os.replace(partial_file, mask_file)
+    print(f"Non-buildable mask written to {mask_file}")
+    return str(mask_file)
+
+
+def ensure_nonbuildable_mask(slope_file, is_nonbuildable, wetlands_file, mask_file, regenerate=False):
+    # Build the mask if it is missing, older than its inputs, or a rebuild was asked for
+    if regenerate or not mask_is_current(mask_file, slope_file, wetlands_file):
+        build_nonbuildable_mask(slope_file, is_nonbuildable, wetlands_file, mask_file)
+    return str(mask_file)
+
+
+def polygonize_mask(mask_file):
+    # Non-buildable areas of a (clipped) mask raster as polygons in the raster's CRS
+    with rasterio.open(mask_file) as src:
+        image = src.read(1)
+        geometries = [shape(s) for s, _ in shapes(image, mask=(image == NONBUILDABLE), transform=src.transform)]
+        crs = src.crs
+
+    return gpd.GeoDataFrame(geometry=geometries, crs=crs)
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != '--regenerate']
+    if len(args) != 1:
+        print("Usage: python nonbuildable_mask.py <OH|VA> [--regenerate]")
+        sys.exit(1)
+    # Each state's calc_bacres module knows its inputs and what counts as unbuildable slope
+    state_module = importlib.import_module(f"calc_bacres_{args[0].upper()}")
+    state_module.prepare_nonbuildable_mask(regenerate='--regenerate' in sys.argv)
@@ -0,0 +1,273 @@
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+from stage_io import read_table, iter_table, table_columns
+
+# Cleaning and scoring of the buildable acres table, shared by the clean_csv GUI and the headless
+# pipeline. Kept free of Qt and of logging setup so importing it has no side effects.
+
+# Function to sanitize the addr_number column
+def sanitize_addr_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+# Function to format columns as whole numbers
+def format_whole_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+# Function to convert a column to whole numbers (vectorized equivalent of format_whole_number)
+def to_whole_numbers(series, convert=format_whole_number):
+    if pd.api.types.is_numeric_dtype(series):
+        # int() truncates toward zero and NaN falls back to 0, the same as astype after fillna
+        return series.fillna(0).astype('int64')
+    return series.apply(convert)
+
+# Function to apply a string transform to the non-null values of a column (str(x).title() etc.)
+def transform_text(series, method):
+    text = series if isinstance(series.dtype, pd.StringDtype) else series.astype(str)
+    return getattr(text.str, method)().where(series.notna(), series)
+
+# Function to split "City ST Zip" addresses into three columns; incomplete addresses give None
+def split_mail_addresses(addresses):
+    # Split from the end, assuming the last two parts are state and zip
+    parts = addresses.str.rsplit(' ', n=2, expand=True).reindex(columns=[0, 1, 2])
+    parts = parts.astype(object)
+    parts.loc[parts[2].isna()] = None
+    parts.columns = ['mail_city', 'mail_state', 'mail_zip']
+    return parts
+
+# Function to sanitize and format the address, owner and acreage columns with whole-column string kernels.
+# string_dtype='pyarrow' stores the text columns as Arrow-backed strings while they are transformed.
+def clean_columns(df, string_dtype=None):
+    text_columns = ['physcity', 'owner', 'mail_address1', 'mail_address3']
+    if string_dtype is not None:
+        for col in text_columns:
+            if col in df.columns:
+                df[col] = df[col].astype(pd.StringDtype(string_dtype))
+
+    # Sanitize and fill NaN values in addr_number with 0 and ensure it's an integer
+    if 'addr_number' in df.columns:
+        df['addr_number'] = to_whole_numbers(df['addr_number'], sanitize_addr_number)
+
+    # Concatenate addr_number, addr_street_name, and addr_street_type, and format as Proper Case
+    if all(col in df.columns for col in ['addr_number', 'addr_street_name', 'addr_street_type']):
+        df['full_address'] = df['addr_number'].astype(str) + ' ' + df['addr_street_name'].fillna('') + ' ' + df['addr_street_type'].fillna('')
+        df['full_address'] = transform_text(df['full_address'], 'title')
+
+    # Format specified columns as Proper Case
+    for col in text_columns:
+        if col in df.columns:
+            df[col] = transform_text(df[col], 'title')
+
+    # Split mail_address3 into City, State, and Zip
+    if 'mail_address3' in df.columns:
+        mail_parts = split_mail_addresses(df['mail_address3'])
+        for col in mail_parts.columns:
+            df[col] = mail_parts[col]
+
+    # Format the mail_state column to be all capital letters
+    if 'mail_state' in df.columns:
+        df['mail_state'] = transform_text(df['mail_state'], 'upper')
+
+    # Format the acreage_calc and acreage_adjacent_with_sameowner columns as whole numbers
+    if 'acreage_calc' in df.columns:
+        df['acreage_calc'] = to_whole_numbers(df['acreage_calc'])
+    if 'acreage_adjacent_with_sameowner' in df.columns:
+        df['acreage_adjacent_with_sameowner'] = df['acreage_adjacent_with_sameowner'].fillna(0).astype(int)
+
+    return df
+
+# Scoring table used by calculate_scores. Each criterion lists its bins in priority order (the first
+# matching bin wins); a bin matches when every bound it sets holds. The score for a criterion is
+# points * weight, and values that match no bin score 0.
+SCORING_CRITERIA = [
+    ('acreage', 5, [
+        {'gt': 750, 'points': 3},
+        {'ge': 501, 'le': 750, 'points': 2},
+        {'ge': 250, 'le': 500, 'points': 1},
+    ]),
+    ('buildable_pc', 5, [
+        {'gt': 70, 'points': 3},
+        {'ge': 50, 'le': 70, 'points': 2},
+        {'ge': 30, 'le': 50, 'points': 1},
+    ]),
+    ('tx_distance', 3, [
+        {'eq': 0, 'points': 3},
+        {'gt': 0, 'le': 0.5, 'points': 2},
+        {'gt': 0.5, 'le': 1, 'points': 1},
+    ]),
+    ('voltage', 1, [
+        {'gt': 500, 'points': 3},
+        {'ge': 235, 'le': 500, 'points': 2},
+        {'ge': 100, 'lt': 235, 'points': 1},
+    ]),
+    ('land_value_per_acre', 1, [
+        {'gt': 2000, 'points': 0},
+        {'ge': 1000, 'le': 2000, 'points': 1},
+        {'ge': 500, 'lt': 1000, 'points': 2},
+        {'gt': 0, 'lt': 500, 'points': 3},
+    ]),
+    ('adjacent_acreage_ratio', 5, [
+        {'gt': 1, 'points': 3},
+        {'ge': 0.5, 'le': 1, 'points': 2},
+        {'ge': 0.1, 'lt': 0.5, 'points': 1},
+    ]),
+]
+
+BOUND_OPERATORS = {
+    'eq': np.equal,
+    'gt': np.greater,
+    'ge': np.greater_equal,
+    'lt': np.less,
+    'le': np.less_equal,
+}
+
+
+# Function to build the per-row inputs of every scoring criterion as whole columns
+def scoring_inputs(df):
+    def column(name):
+        if name in df.columns:
+            return pd.to_numeric(df[name], errors='coerce')
+        return pd.Series(0, index=df.index)
+
+    acreage_calc = column('acreage_calc')
+    has_acreage = acreage_calc != 0
+
+    return {
+        'acreage': acreage_calc,
+        'buildable_pc': ((column('Bacres') / acreage_calc) * 100).where(has_acreage, 0),
+        'tx_distance': column('distance_to_transmission_line_miles'),
+        'voltage': column('voltage_of_closest_line'),
+        'land_value_per_acre': (column('mkt_val_land') / acreage_calc).where(has_acreage, 0),
+        'adjacent_acreage_ratio': (column('acreage_adjacent_with_sameowner') / acreage_calc).where(has_acreage, 0),
+    }
+
+
+# Function to calculate quality scores for all rows at once
+def calculate_scores(df, breakdown=False):
+    inputs = scoring_inputs(df)
+    scores = pd.DataFrame(index=df.index)
+
+    for criterion, weight, bins in SCORING_CRITERIA:
+        values = inputs[criterion].to_numpy(dtype=float)
+        conditions = []
+        for score_bin in bins:
+            condition = np.ones(len(values), dtype=bool)
+            for bound, operator in BOUND_OPERATORS.items():
+                if bound in score_bin:
+                    condition &= operator(values, score_bin[bound])
+            conditions.append(condition)
+        points = np.select(conditions, [score_bin['points'] for score_bin in bins], default=0)
+        scores[f'score_{criterion}'] = points * weight
+
+    total = scores.sum(axis=1).astype('int64')
+    if breakdown:
+        scores['Score'] = total
+        return scores
+    return total
+
+# Select and order the specified columns, ensure 'BAcres' is next to 'county_id'
+ESSENTIAL_COLUMNS = [
+    'owner', 'county_name', 'state_abbr', 'full_address', 'physcity', 'mail_address1',
+    'mail_city', 'mail_state', 'mail_zip', 'parcel_id', 'acreage_calc', 'county_id', 'BAcres',
+    'distance_to_transmission_line_miles', 'voltage_of_closest_line',
+    'acreage_adjacent_with_sameowner', 'mkt_val_land', 'land_use_code',
+    'latitude', 'longitude', 'land_cover', 'Score'
+]
+
+# Inputs larger than this are processed in chunks of DEFAULT_CHUNK_SIZE rows
+STREAMING_THRESHOLD_BYTES = 512 * 1024 ** 2
+DEFAULT_CHUNK_SIZE = 100000
+
+# Function to order columns with the essential columns first, followed by the remaining columns
+def order_columns(columns):
+    # Ensure all specified columns are present in the DataFrame
+    existing_essential_columns = [col for col in ESSENTIAL_COLUMNS if col in columns]
+
+    # Get the remaining columns not specified in essential_columns
+    remaining_columns = [col for col in columns if col not in existing_essential_columns]
+
+    # Concatenate the essential columns with the remaining columns
+    return existing_essential_columns + remaining_columns
+
+# Function to predict the columns clean_dataframe produces from the input header alone
+def cleaned_columns(input_columns, score_breakdown=False):
+    columns = list(input_columns)
+    added = []
+    if all(col in columns for col in ['addr_number', 'addr_street_name', 'addr_street_type']):
+        added.append('full_address')
+    if 'mail_address3' in columns:
+        added.extend(['mail_city', 'mail_state', 'mail_zip'])
+    if score_breakdown:
+        added.extend(f'score_{criterion}' for criterion, _, _ in SCORING_CRITERIA)
+    added.append('Score')
+    return columns + [col for col in added if col not in columns]
+
+# Function to clean and score a DataFrame
+def clean_dataframe(df, score_breakdown=False, string_dtype=None):
+    df = clean_columns(df, string_dtype)
+
+    # Calculate quality scores, optionally keeping the points earned for each criterion
+    with stage('scoring') as record:
+        if score_breakdown:
+            scores = calculate_scores(df, breakdown=True)
+            for col in scores.columns:
+                df[col] = scores[col]
+        else:
+            df['Score'] = calculate_scores(df)
+        df['Score'] = df['Score'].round(1)
+        record['rows'] = len(df)
+    return df
+
+# Function to clean, score and write the CSV file chunk by chunk, so memory depends on chunksize
+def process_csv_in_chunks(input_file, output_file, chunksize=DEFAULT_CHUNK_SIZE, score_breakdown=False,
+                          string_dtype=None):
+    # The output column order is fixed up front from the header
+    header = table_columns(input_file)
+    columns = order_columns(cleaned_columns(header, score_breakdown))
+
+    rows = 0
+    with open(output_file, 'w', newline='') as f:
+        for chunk in iter_table(input_file, chunksize):
+            chunk = clean_dataframe(chunk, score_breakdown, string_dtype)
+            chunk.to_csv(f, index=False, header=(rows == 0), columns=columns)
+            rows += len(chunk)
+        if rows == 0:
+            pd.DataFrame(columns=columns).to_csv(f, index=False)
+
+    logging.info(f"Processed {rows} rows in chunks of {chunksize}.")
+
+# Function to process the CSV file
+def process_csv(input_file, output_file, score_breakdown=False, string_dtype=None, chunksize=None):
+    try:
+        if chunksize is None and os.path.getsize(input_file) > STREAMING_THRESHOLD_BYTES:
+            chunksize = DEFAULT_CHUNK_SIZE
+
+        if chunksize:
+            process_csv_in_chunks(input_file, output_file, chunksize, score_breakdown, string_dtype)
+        else:
+            # The buildable acres stage hands over a CSV, or a GeoParquet file when it writes parquet
+            df = read_table(input_file)
+            logging.info("Input file loaded successfully.")
+
+            df = clean_dataframe(df, score_breakdown, string_dtype)
+
+            # Reorder DataFrame to have essential columns first, followed by remaining columns
+            df_final = df[order_columns(df.columns)]
+
+            # Save the adjusted DataFrame to a new CSV file
+            df_final.to_csv(output_file, index=False)
+        logging.info(f"File saved to {output_file}")
+
+    except Exception as e:
+        logging.error(f"Error processing CSV file: {e}")
+        raise RuntimeError(f"Error processing CSV file: {e}")
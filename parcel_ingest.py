@@ -0,0 +1,124 @@
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+
+from stage_io import write_layer
+
+# Geometry encodings the API can include in a record, cheapest to parse first
+GEOMETRY_FIELDS = ('geom_as_wkb', 'geom_as_wkt', 'geometry')
+# API fields the later stages read: those among parcel_cleaning.ESSENTIAL_COLUMNS, the address parts
+# parcel_cleaning combines and splits, and land_use_class (tax exempt filter, incremental hashes)
+INGEST_COLUMNS = [
+    'owner', 'county_name', 'state_abbr', 'physcity', 'mail_address1', 'parcel_id', 'acreage_calc', 'county_id',
+    'acreage_adjacent_with_sameowner', 'mkt_val_land', 'land_use_code', 'latitude', 'longitude', 'land_cover',
+    'addr_number', 'addr_street_name', 'addr_street_type', 'mail_address3', 'land_use_class', 'geometry_missing'
+]
+# Numeric API fields the later stages compute with. Streamed layers declare them as real numbers up
+# front, so a first page where one of them is null everywhere does not create it as a text field
+NUMERIC_FIELDS = ['acreage_calc', 'acreage_adjacent_with_sameowner', 'mkt_val_land', 'latitude', 'longitude']
+# Text columns with few distinct values per county, stored once per value instead of once per row
+CATEGORICAL_COLUMNS = ['county_id', 'county_name', 'state_abbr', 'physcity', 'land_use_code', 'land_use_class',
+                       'land_cover']
+
+
+def decode_geometries(results):
+    # Decode the geometry of every record in one array-level call, using the cheapest encoding
+    # present in the payload. Returns an array aligned with `results`, with None for records
+    # that have no (or an unparseable) geometry.
+    field = next((f for f in GEOMETRY_FIELDS if any(f in res for res in results)), None)
+    if field is None:
+        return np.full(len(results), None, dtype=object)
+
+    if field == 'geometry':
+        # GeoJSON geometry objects
+        values = np.array([json.dumps(res[field]) if res.get(field) else None for res in results], dtype=object)
+        return shapely.from_geojson(values, on_invalid='ignore')
+
+    values = np.array([res.get(field) if isinstance(res.get(field), (str, bytes)) and res.get(field) else None
+                       for res in results], dtype=object)
+    if field == 'geom_as_wkb':
+        return shapely.from_wkb(values, on_invalid='ignore')
+    return shapely.from_wkt(values, on_invalid='ignore')
+
+
+def compact_parcels(gdf, columns=INGEST_COLUMNS):
+    # Keep only the given columns (and the geometry), store repeated strings as categoricals and
+    # downcast integer columns to the smallest type that holds them. Floats stay float64: float32
+    # would round coordinates and acreage.
+    keep = [col for col in columns if col in gdf.columns and col != gdf.geometry.name]
+    gdf = gdf[keep + [gdf.geometry.name]].copy()
+    for col in keep:
+        if col in CATEGORICAL_COLUMNS:
+            gdf[col] = gdf[col].astype('category')
+        elif pd.api.types.is_integer_dtype(gdf[col]):
+            gdf[col] = pd.to_numeric(gdf[col], downcast='integer')
+    return gdf
+
+
+def results_to_geodataframe(results, missing_geometry='drop', compact=False):
+    # missing_geometry: 'drop' removes records without a geometry, 'flag' keeps them with an empty
+    # geometry and geometry_missing=True. Attributes and shapes stay aligned either way.
+    # compact=True applies compact_parcels to the frame.
+    geometries = decode_geometries(results)
+    # A GeoJSON 'geometry' attribute is replaced by the decoded shapes
+    df = pd.DataFrame(results).drop(columns='geometry', errors='ignore')
+    gdf = gpd.GeoDataFrame(df, geometry=geometries, crs="EPSG:4326")
+
+    missing = gdf.geometry.isna()
+    if missing.any():
+        logging.warning(f"{int(missing.sum())} of {len(gdf)} records have no geometry")
+        if missing_geometry == 'drop':
+            gdf = gdf[~missing]
+        elif missing_geometry == 'flag':
+            gdf['geometry_missing'] = missing
+
+    return compact_parcels(gdf) if compact else gdf
+
+
+def match_schema(gdf, dtypes):
+    # Reindex a page to the layer's columns and cast numeric columns to the layer's types, so GDAL
+    # appends every page to the same field types
+    gdf = gdf.reindex(columns=list(dtypes.index))
+    for col, dtype in dtypes.items():
+        if col == gdf.geometry.name:
+            continue
+        if pd.api.types.is_float_dtype(dtype):
+            gdf[col] = pd.to_numeric(gdf[col], errors='coerce').astype(dtype)
+        elif pd.api.types.is_integer_dtype(dtype):
+            values = pd.to_numeric(gdf[col], errors='coerce')
+            # A page with gaps in an integer field is written as floats; GDAL stores them as integers
+            gdf[col] = values.astype(dtype) if values.notna().all() else values
+    return gdf
+
+
+def stream_pages_to_gpkg(pages, save_path, layer=None):
+    # Convert each page of API results and append it to the GeoPackage layer as soon as it arrives.
+    # Only one page is held in memory, and pages written before a failure stay on disk.
+    # The first page creates the layer; NUMERIC_FIELDS are always real numbers, and fields that first
+    # appear on a later page cannot be added to the layer and are dropped with a warning.
+    # Returns the number of records written.
+    dtypes = None
+    dropped = set()
+    record_count = 0
+    for results in pages:
+        gdf = results_to_geodataframe(results)
+        for col in NUMERIC_FIELDS:
+            if col in gdf.columns:
+                gdf[col] = pd.to_numeric(gdf[col], errors='coerce').astype('float64')
+        if dtypes is None:
+            dtypes = gdf.dtypes
+            write_layer(gdf, save_path, layer=layer)
+        else:
+            new_columns = [col for col in gdf.columns if col not in dtypes.index and col not in dropped]
+            if new_columns:
+                logging.warning(f"Dropping fields not in the layer created from the first page: "
+                                f"{', '.join(new_columns)}")
+                dropped.update(new_columns)
+            write_layer(match_schema(gdf, dtypes), save_path, layer=layer, mode='a')
+        record_count += len(gdf)
+
+    return record_count
@@ -0,0 +1,208 @@
+import argparse
+import importlib
+import logging
+import os
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from reportall_client import iter_pages, PageCache, build_query_params, state_for_county, api_url
+from parcel_ingest import results_to_geodataframe
+from tx_proximity import (add_transmission_line_distances, subset_near_lines, drop_tax_exempt, proximity_columns,
+                          NEAREST_LINE_COUNT, VOLTAGE_CLASSES_KV)
+from parcel_cleaning import clean_dataframe, order_columns
+from instrumentation import new_report, active_report, stage, write_report
+from incremental import (parcel_hashes, load_state, save_state, unchanged_mask, reuse_proximity, reusable_bacres,
+                         reuse_bacres, STATE_SUFFIX)
+from stage_io import write_layer, stage_formats, stage_output_path, FORMATS
+
+# Stage outputs that can be written to disk; by default only the cleaned CSV is written
+STAGES = ('fetch', 'proximity', 'bacres', 'clean')
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.reportall_cache')
+# Buildable acres engines of the calc_bacres modules (see their BACRES_ENGINE)
+BACRES_ENGINES = ('vector', 'raster')
+
+
+def fetch_parcels(county_id, owner='', parcel_id='', calc_acreage_min='', cache=None, compact=True):
+    # compact=True keeps only the columns later stages use, in compact dtypes (see parcel_ingest.compact_parcels)
+    params = build_query_params(county_id, owner, parcel_id, calc_acreage_min)
+    all_results = []
+    for page_results in iter_pages(api_url, params, cache=cache):
+        all_results.extend(page_results)
+
+    if not all_results:
+        return None
+    return results_to_geodataframe(all_results, compact=compact)
+
+
+def new_summary(county_id):
+    # Run report for one county: outputs plus a record per stage (see instrumentation.stage)
+    return new_report(county_id=str(county_id), state=state_for_county(county_id), outputs={})
+
+
+def output_base(out_dir, county_id):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    return str(out_dir / str(county_id))
+
+
+def run_fetch_stage(county_id, out_dir='.', owner='', parcel_id='', calc_acreage_min='', write=('clean',),
+                    cache=None, formats=None, compact=True):
+    # Network-bound part of the pipeline. Returns (parcels, summary); parcels is None if nothing matched.
+    # formats maps stage names to the format their written outputs use (see stage_io.stage_formats).
+    summary = new_summary(county_id)
+
+    with stage('fetch', summary) as record:
+        parcels = fetch_parcels(county_id, owner, parcel_id, calc_acreage_min, cache, compact)
+        record['rows'] = 0 if parcels is None else len(parcels)
+    if parcels is None:
+        summary['status'] = 'no results'
+        return None, summary
+    if 'fetch' in write:
+        summary['outputs']['fetch'] = write_layer(parcels, stage_output_path(output_base(out_dir, county_id),
+                                                                               'fetch', formats))
+
+    return parcels, summary
+
+
+def run_processing_stages(parcels, summary, out_dir='.', write=('clean',), max_distance_miles=None,
+                          incremental=False, formats=None, multi_proximity=False, engine=None):
+    # CPU-bound part of the pipeline: proximity -> buildable acres -> clean/score on fetched parcels.
+    # In incremental mode, parcels whose id, geometry and key attributes match the previous run's
+    # <county>_parcel_state.parquet reuse its distance, voltage and Bacres; only new or changed
+    # parcels go through proximity and buildable acres. The state file is rewritten after each run.
+    # multi_proximity adds the distances to the NEAREST_LINE_COUNT nearest lines and the closest line
+    # of each VOLTAGE_CLASSES_KV class to the proximity columns. engine picks the buildable acres
+    # engine ('vector' or 'raster'); None keeps the state module's BACRES_ENGINE.
+    base = output_base(out_dir, summary['county_id'])
+    bacres_module = importlib.import_module(f"calc_bacres_{summary['state']}")
+    proximity_options = {'nearest_count': NEAREST_LINE_COUNT, 'voltage_classes': VOLTAGE_CLASSES_KV} \
+        if multi_proximity else {}
+    columns = proximity_columns(**proximity_options)
+
+    hashes = parcel_hashes(parcels)
+    state = load_state(base + STATE_SUFFIX, columns, max_distance_miles) if incremental else None
+    unchanged = unchanged_mask(parcels, hashes, state) if state is not None else pd.Series(False, index=parcels.index)
+    summary['reused_parcels'] = int(unchanged.sum())
+
+    # Substages recorded inside the bacres and scoring code (slope, overlay, ...) land in the same report
+    with active_report(summary):
+        with stage('proximity') as record:
+            fetched = parcels
+            measured = None
+            if not incremental or not drop_tax_exempt(parcels[~unchanged]).empty:
+                measured = add_transmission_line_distances(parcels[~unchanged], max_distance_miles=max_distance_miles,
+                                                           **proximity_options)
+            if unchanged.any():
+                measured = reuse_proximity(parcels[unchanged], measured, state, columns)
+            parcels = measured
+            subset = subset_near_lines(parcels)
+            record['rows'] = len(subset)
+        if 'proximity' in write:
+            summary['outputs']['proximity'] = write_layer(
+                parcels, stage_output_path(base + "_dist_from_line", 'proximity', formats))
+            summary['outputs']['proximity_subset'] = write_layer(
+                subset, stage_output_path(base + "_2m", 'proximity', formats))
+        if subset.empty:
+            if incremental:
+                save_state(base + STATE_SUFFIX, fetched, hashes, parcels, columns=columns,
+                           max_distance_miles=max_distance_miles)
+            summary['status'] = 'no parcels near lines'
+            return summary
+
+        with stage('bacres') as record:
+            reuse = reusable_bacres(subset, unchanged, state) if state is not None else pd.Series(False, index=subset.index)
+            bacres = None
+            if not reuse.all():
+                bacres = bacres_module.compute_bacres(subset[~reuse].copy(),
+                                                      engine=engine or bacres_module.BACRES_ENGINE)
+            if reuse.any():
+                bacres = reuse_bacres(subset[reuse], bacres, state)
+            record['rows'] = len(bacres)
+        if incremental:
+            save_state(base + STATE_SUFFIX, fetched, hashes, parcels, bacres, columns, max_distance_miles)
+        if 'bacres' in write:
+            summary['outputs']['bacres'] = write_layer(
+                bacres, stage_output_path(base + "_2m_buildable_acres", 'bacres', formats))
+
+        with stage('clean') as record:
+            cleaned = clean_dataframe(pd.DataFrame(bacres))
+            cleaned = cleaned[order_columns(cleaned.columns)]
+            record['rows'] = len(cleaned)
+        if 'clean' in write:
+            summary['outputs']['clean'] = base + "_2m_buildable_acres_clean.csv"
+            cleaned.to_csv(summary['outputs']['clean'], index=False)
+
+    summary['status'] = 'ok'
+    return summary
+
+
+def run_pipeline(county_id, out_dir='.', owner='', parcel_id='', calc_acreage_min='', write=('clean',),
+                 cache=None, max_distance_miles=None, incremental=False, formats=None, compact=True,
+                 multi_proximity=False, engine=None):
+    # Run fetch -> proximity -> buildable acres -> clean/score in this process, handing GeoDataFrames
+    # from one stage to the next. Only the stages listed in `write` save their output under out_dir,
+    # using the same file names as the GUI chain. Returns the run report: files plus time, CPU,
+    # memory, I/O and row counts for every stage.
+    parcels, summary = run_fetch_stage(county_id, out_dir, owner, parcel_id, calc_acreage_min, write, cache, formats,
+                                       compact)
+    if parcels is None:
+        return summary
+    return run_processing_stages(parcels, summary, out_dir, write, max_distance_miles, incremental, formats,
+                                 multi_proximity, engine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the parcel prospecting chain for one county without the GUIs.")
+    parser.add_argument('county_id')
+    parser.add_argument('--owner', default='')
+    parser.add_argument('--parcel-id', default='')
+    parser.add_argument('--acreage-min', default='')
+    parser.add_argument('--out-dir', default='.')
+    parser.add_argument('--write', nargs='+', choices=STAGES, default=['clean'],
+                        help="stages whose output is saved to disk")
+    parser.add_argument('--max-distance-miles', type=float, default=None,
+                        help="do not measure parcels farther than this from a transmission line")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--offline', action='store_true', help="replay cached API pages only")
+    parser.add_argument('--multi-proximity', action='store_true',
+                        help=f"also measure the {NEAREST_LINE_COUNT} nearest lines and the closest line at or above "
+                             f"{' and '.join(str(kv) for kv in VOLTAGE_CLASSES_KV)} kV")
+    parser.add_argument('--engine', choices=BACRES_ENGINES, default=None,
+                        help="buildable acres engine: 'vector' overlays polygonized slope, 'raster' counts "
+                             "buildable pixels per parcel (default: the state script's BACRES_ENGINE)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="reuse the previous run's results for parcels that have not changed")
+    parser.add_argument('--format', nargs='+', default=[], metavar='STAGE=FORMAT',
+                        help=f"format of a written stage output ({', '.join(FORMATS)}; default gpkg), "
+                             f"e.g. proximity=parquet")
+    parser.add_argument('--all-columns', action='store_true',
+                        help="keep every API column instead of only those the stages use")
+    parser.add_argument('--report', default=None,
+                        help="JSON run report path (default: <out-dir>/<county_id>_run_report.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, filename='pipeline_debug.log', filemode='w',
+                        format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+    cache = PageCache(args.cache_dir, offline=args.offline)
+    summary = run_pipeline(args.county_id, args.out_dir, args.owner, args.parcel_id, args.acreage_min,
+                           args.write, cache, args.max_distance_miles, args.incremental, stage_formats(args.format),
+                           not args.all_columns, args.multi_proximity, args.engine)
+
+    report_file = args.report or output_base(args.out_dir, args.county_id) + "_run_report.json"
+    write_report(summary, report_file)
+
+    print(f"County {summary['county_id']} ({summary['state']}): {summary['status']}")
+    for name, record in summary['stages'].items():
+        print(f"  {name}: {record['rows']} rows in {record['wall_seconds']:.2f}s "
+              f"(cpu {record['cpu_seconds']:.2f}s, peak rss {record['peak_rss_mb']} MB)")
+    for name, path in summary['outputs'].items():
+        print(f"  {name} output: {path}")
+    print(f"  run report: {report_file}")
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
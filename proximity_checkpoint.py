@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def parcels_fingerprint(parcels, max_distance_miles=None, columns=None):
+    # Identifies the parcels (ids and geometry, in order) and settings a checkpoint was made for, so a
+    # checkpoint from a different pull, search radius or set of result columns is never reused
+    digest = hashlib.sha1()
+    digest.update(json.dumps([len(parcels), max_distance_miles, parcels.crs.to_string()]).encode())
+    if columns is not None:
+        digest.update(json.dumps(list(columns)).encode())
+    digest.update('\n'.join(parcels['parcel_id'].astype(str)).encode())
+    digest.update(b''.join(shapely.to_wkb(parcels.geometry.to_numpy())))
+    return digest.hexdigest()
+
+
+def clear_checkpoint(checkpoint_dir):
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+
+def checkpoint_dir_for(input_file):
+    # Sidecar directory next to the input file
+    return str(Path(input_file).parent / (Path(input_file).stem + "_proximity_checkpoint"))
+
+
+class ProximityCheckpoint:
+    # Proximity results finished so far for one set of parcels, kept in a sidecar directory as one
+    # parquet file per saved chunk. Rows are the parcels' positions in the (filtered) input.
+    def __init__(self, checkpoint_dir, fingerprint):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.fingerprint = fingerprint
+        self.chunks_saved = 0
+
+    def load(self):
+        # Returns the saved rows (row, parcel_id and the result columns), or None if there is no usable checkpoint
+        manifest_path = self.checkpoint_dir / MANIFEST_NAME
+        if not manifest_path.is_file():
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('fingerprint') != self.fingerprint:
+            print("Ignoring proximity checkpoint made for different parcels")
+            self.clear()
+            return None
+
+        chunk_files = sorted(self.checkpoint_dir.glob('chunk_*.parquet'))
+        self.chunks_saved = len(chunk_files)
+        if not chunk_files:
+            return None
+        saved = pd.concat([pd.read_parquet(path) for path in chunk_files], ignore_index=True)
+        for col in saved.columns:
+            if col.startswith('voltage_'):
+                saved[col] = saved[col].astype(object).where(saved[col].notna(), None)
+        return saved
+
+    def save(self, rows, parcel_ids, results):
+        # results: the rows' distance_* and voltage_* columns
+        if len(rows) == 0:
+            return
+        if self.chunks_saved == 0:
+            self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.checkpoint_dir / MANIFEST_NAME, 'w') as f:
+                json.dump({'fingerprint': self.fingerprint}, f)
+
+        chunk = pd.DataFrame({
+            'row': np.asarray(rows, dtype='int64'),
+            'parcel_id': pd.Series(parcel_ids).astype(str).to_numpy(),
+        })
+        for col in results.columns:
+            if col.startswith('voltage_'):
+                chunk[col] = pd.array(list(results[col]), dtype='Int64')
+            else:
+                chunk[col] = pd.to_numeric(results[col], errors='coerce').to_numpy()
+        # Written under a temporary name first so a crash never leaves a half-written chunk behind
+        chunk_path = self.checkpoint_dir / f"chunk_{self.chunks_saved:05d}.parquet"
+        partial_path = str(chunk_path) + ".partial"
+        chunk.to_parquet(partial_path, index=False)
+        os.replace(partial_path, chunk_path)
+        self.chunks_saved += 1
+
+    def clear(self):
+        clear_checkpoint(self.checkpoint_dir)
+        self.chunks_saved = 0
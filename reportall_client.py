@@ -0,0 +1,209 @@
+import gzip
+import hashlib
+import json
+import math
+import logging
+import os
+import time
+from collections import deque
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation import emit_progress
+
+# API and authentication details
+client_key = 'RqMXhNFKlQ'  # Replace with your actual client token
+api_version = '9'  # API version
+api_url = "https://reportallusa.com/api/parcels"
+
+# Mapping of County_ID prefixes to states
+STATE_MAPPING = {
+    '39': 'OH',  # Ohio
+    '51': 'VA',  # Virginia
+    # Add more states here as needed
+}
+
+# Number of pages downloaded at the same time once the page count is known
+MAX_CONCURRENT_PAGES = 4
+# Retry policy for throttled (429) and failing (5xx) responses
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+REQUEST_TIMEOUT = 60  # seconds
+
+# Cached pages older than this are refetched (unless running offline)
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+# Least recently used pages are evicted once the cache grows past this size
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+# Query parameters that do not change the response and are left out of the cache key
+CACHE_EXCLUDED_PARAMS = ('client', 'page')
+
+
+class OfflineCacheMiss(requests.exceptions.RequestException):
+    pass
+
+
+class PageCache:
+    # Content-addressed store of raw, gzip-compressed API pages keyed on the normalized query.
+    # In offline mode only cached pages are served (regardless of age) and a miss raises.
+    def __init__(self, cache_dir, ttl=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES, offline=False):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+    def key(self, params, page):
+        # Empty values are dropped so owner='' and a missing owner share an entry
+        normalized = {k: str(v).strip() for k, v in params.items()
+                      if k not in CACHE_EXCLUDED_PARAMS and str(v).strip() != ''}
+        normalized['page'] = str(page)
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json.gz"
+
+    def get(self, params, page):
+        path = self.path(self.key(params, page))
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+
+        if not self.offline and self.ttl is not None and time.time() - stat.st_mtime > self.ttl:
+            path.unlink(missing_ok=True)
+            return None
+
+        with gzip.open(path, 'rb') as f:
+            content = f.read()
+        # Record the access time for LRU eviction, keeping mtime as the fetch time for the TTL
+        os.utime(path, (time.time(), stat.st_mtime))
+        return content
+
+    def put(self, params, page, content):
+        path = self.path(self.key(params, page))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+        with gzip.open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        if self.max_bytes is None or not self.cache_dir.exists():
+            return
+        entries = []
+        for path in self.cache_dir.glob('*/*.json.gz'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # Evicted by another run in the meantime
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def build_query_params(county_id, owner='', parcel_id='', calc_acreage_min=''):
+    return {
+        'client': client_key,
+        'v': api_version,
+        'county_id': county_id,
+        'owner': owner,
+        'parcel_id': parcel_id,
+        'calc_acreage_min': calc_acreage_min,
+        'returnGeometry': 'true',
+        'f': 'geojson',
+        'page': 1
+    }
+
+
+def state_for_county(county_id):
+    county_id_prefix = str(county_id)[:2]
+    state_code = STATE_MAPPING.get(county_id_prefix)
+
+    if state_code is None:
+        raise ValueError(f"Unrecognized County_ID prefix: {county_id_prefix}. Please update the state mapping.")
+
+    return state_code
+
+
+def create_session(max_workers=MAX_CONCURRENT_PAGES):
+    # Keep-alive session whose connection pool is large enough for every worker thread
+    retry = Retry(total=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR, status_forcelist=RETRY_STATUS_CODES,
+                  allowed_methods=['GET'], respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def fetch_page(session, api_url, params, page, cache=None):
+    if cache is not None:
+        content = cache.get(params, page)
+        if content is not None:
+            return json.loads(content)
+        if cache.offline:
+            raise OfflineCacheMiss(f"Page {page} of this query is not cached and offline mode is on")
+
+    response = session.get(api_url, params=dict(params, page=page), timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    # Only pages with records are cached; an error payload or an empty page returned with a 200
+    # would otherwise stand in for the county until the entry expires
+    if cache is not None and data.get('results') and 'count' in data:
+        cache.put(params, page, response.content)
+    return data
+
+
+def iter_pages(api_url, params, max_workers=MAX_CONCURRENT_PAGES, session=None, cache=None):
+    # Yield the 'results' list of every page in page order.
+    # Page 1 is fetched first to learn the total count; the remaining pages are then downloaded
+    # concurrently, with at most max_workers pages in flight so memory stays bounded.
+    # With a PageCache, cached pages are served from disk and new pages are stored.
+    own_session = session is None
+    if own_session:
+        session = create_session(max_workers)
+
+    try:
+        first_page = fetch_page(session, api_url, params, 1, cache)
+        results = first_page.get('results')
+        if not results:
+            return
+        yield results
+
+        total_pages = math.ceil(first_page['count'] / len(results))
+        logging.info(f"{first_page['count']} records across {total_pages} pages")
+        emit_progress('fetch', 1, total_pages)
+        if total_pages <= 1:
+            return
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = deque()
+            next_page = 2
+            try:
+                while next_page <= total_pages or pending:
+                    while next_page <= total_pages and len(pending) < max_workers:
+                        pending.append(pool.submit(fetch_page, session, api_url, params, next_page, cache))
+                        next_page += 1
+
+                    results = pending.popleft().result().get('results')
+                    if not results:
+                        break
+                    emit_progress('fetch', next_page - len(pending) - 1, total_pages)
+                    yield results
+            finally:
+                for future in pending:
+                    future.cancel()
+    finally:
+        if own_session:
+            session.close()
+        if cache is not None:
+            cache.evict()
@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from osgeo import gdal
+
+# Enable GDAL exceptions
+gdal.UseExceptions()
+
+# Side length (in pixels) of the DEM blocks each worker turns into slope
+TILE_SIZE_PIXELS = 4096
+# DEM pixels read around every block so the 3x3 slope kernel matches a single full-raster pass
+HALO_PIXELS = 1
+OVERVIEW_LEVELS = [2, 4, 8, 16, 32]
+SLOPE_NODATA = -9999
+CREATION_OPTIONS = ['TILED=YES', 'BLOCKXSIZE=512', 'BLOCKYSIZE=512', 'COMPRESS=DEFLATE', 'PREDICTOR=3',
+                    'BIGTIFF=IF_SAFER']
+
+
+def slope_cache_is_current(dem_file, cache_file):
+    # The cache is stale once the DEM has been replaced or edited after it was built
+    return Path(cache_file).is_file() and os.path.getmtime(cache_file) >= os.path.getmtime(dem_file)
+
+
+def slope_tile(dem_file, xoff, yoff, xsize, ysize, width, height):
+    # Percent slope of one DEM block, computed on the block plus its halo and trimmed back to the block
+    x0, y0 = max(xoff - HALO_PIXELS, 0), max(yoff - HALO_PIXELS, 0)
+    x1, y1 = min(xoff + xsize + HALO_PIXELS, width), min(yoff + ysize + HALO_PIXELS, height)
+
+    dem_tile = f"/vsimem/dem_{xoff}_{yoff}.tif"
+    slope_file = f"/vsimem/slope_{xoff}_{yoff}.tif"
+    try:
+        gdal.Translate(dem_tile, dem_file, srcWin=[x0, y0, x1 - x0, y1 - y0])
+        slope_ds = gdal.DEMProcessing(slope_file, dem_tile, 'slope', computeEdges=True, options=['-p'])
+        slope = slope_ds.GetRasterBand(1).ReadAsArray(xoff - x0, yoff - y0, xsize, ysize)
+        slope_ds = None
+    finally:
+        gdal.Unlink(dem_tile)
+        gdal.Unlink(slope_file)
+
+    return slope
+
+
+def build_slope_cache(dem_file, cache_file, tile_size=TILE_SIZE_PIXELS, max_workers=None):
+    # One-time build: compute the statewide percent slope block by block on a thread pool (GDAL
+    # releases the GIL) and save it as a tiled, compressed GeoTIFF with overviews, so each run
+    # only reads the tiles under its parcels. The file is written under a temporary name and
+    # moved into place when complete.
+    cache_file = Path(cache_file)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    partial_file = str(cache_file) + ".partial.tif"
+
+    gdal.SetConfigOption('GDAL_NUM_THREADS', 'ALL_CPUS')
+    dem = gdal.Open(str(dem_file))
+    width, height = dem.RasterXSize, dem.RasterYSize
+
+    out = gdal.GetDriverByName('GTiff').Create(partial_file, width, height, 1, gdal.GDT_Float32,
+                                               options=CREATION_OPTIONS)
+    out.SetGeoTransform(dem.GetGeoTransform())
+    out.SetProjection(dem.GetProjection())
+    band = out.GetRasterBand(1)
+    band.SetNoDataValue(SLOPE_NODATA)
+    dem = None
+
+    blocks = [(xoff, yoff, min(tile_size, width - xoff), min(tile_size, height - yoff))
+              for yoff in range(0, height, tile_size) for xoff in range(0, width, tile_size)]
+    write_lock = threading.Lock()
+
+    def process(block):
+        slope = slope_tile(str(dem_file), *block, width, height)
+        with write_lock:
+            band.WriteArray(slope, block[0], block[1])
+
+    print(f"Computing slope for {len(blocks)} blocks of {dem_file}...")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for done, _ in enumerate(executor.map(process, blocks), start=1):
+            print(f"  {done}/{len(blocks)} blocks")
+
+    print("Building overviews...")
+    out.BuildOverviews('AVERAGE', OVERVIEW_LEVELS)
+    band = None
+    out = None
+
+    os.replace(partial_file, cache_file)
+    print(f"Slope cache written to {cache_file}")
+    return str(cache_file)
+
+
+def ensure_slope_cache(dem_file, cache_file, regenerate=False):
+    # Build the slope cache if it is missing, older than the DEM, or a rebuild was asked for
+    if regenerate or not slope_cache_is_current(dem_file, cache_file):
+        build_slope_cache(dem_file, cache_file)
+    return str(cache_file)
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != '--regenerate']
+    if len(args) != 2:
+        print("Usage: python slope_cache.py <dem_file> <slope_cache.tif> [--regenerate]")
+        sys.exit(1)
+    ensure_slope_cache(args[0], args[1], regenerate='--regenerate' in sys.argv)
@@ -0,0 +1,142 @@
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+import geopandas as gpd
+import shapely
+from pyproj import CRS
+
+# pyarrow lets GDAL hand whole record batches to and from pandas instead of one feature at a time,
+# and is needed for GeoParquet; without it GPKG/shapefile I/O falls back to the per-feature path
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# Formats a stage can hand its output to the next one in. GeoParquet is columnar and stores geometry
+# as WKB, so writing and reading it costs a fraction of a GeoPackage; GeoPackage opens everywhere.
+FORMATS = {'gpkg': '.gpkg', 'parquet': '.parquet'}
+DEFAULT_FORMAT = 'gpkg'
+# Per-stage formats from the environment, e.g. PARCEL_STAGE_FORMATS="proximity=parquet,bacres=parquet"
+STAGE_FORMATS_ENV = 'PARCEL_STAGE_FORMATS'
+PARQUET_SUFFIXES = ('.parquet', '.geoparquet')
+DRIVERS = {'.gpkg': 'GPKG', '.shp': 'ESRI Shapefile'}
+# CSV tables are read so they hold the same values as their GeoParquet counterpart: floats parse back
+# to the exact double that was written (the default parser can be off by one ulp) and parcel ids stay
+# strings with their leading zeros. Other columns still get CSV type inference, so a code stored as
+# text in GeoParquet (e.g. county_id) comes back from a CSV as a number.
+CSV_READ_OPTIONS = {'float_precision': 'round_trip', 'dtype': {'parcel_id': str}}
+
+
+def stage_formats(specs=None):
+    # Parse "stage=format" entries (from the environment, then specs) into {stage: format}
+    entries = [e for e in os.environ.get(STAGE_FORMATS_ENV, '').split(',') if e.strip()]
+    entries += list(specs or [])
+    formats = {}
+    for entry in entries:
+        stage_name, _, fmt = entry.partition('=')
+        fmt = fmt.strip().lower()
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown intermediate format '{fmt}' for stage '{stage_name}' "
+                             f"(choose from {', '.join(FORMATS)})")
+        formats[stage_name.strip()] = fmt
+    return formats
+
+
+def stage_format(stage_name, formats=None):
+    # Format configured for a stage, or None if it was left at the caller's default
+    formats = stage_formats() if formats is None else formats
+    return formats.get(stage_name)
+
+
+def stage_output_path(base, stage_name, formats=None, default_suffix=FORMATS[DEFAULT_FORMAT]):
+    # base is the output path without its extension
+    fmt = stage_format(stage_name, formats)
+    return str(base) + (FORMATS[fmt] if fmt else default_suffix)
+
+
+def is_parquet(path):
+    return Path(path).suffix.lower() in PARQUET_SUFFIXES
+
+
+def write_layer(gdf, path, layer=None, mode='w'):
+    # Write a GeoDataFrame in the format given by the file extension
+    if is_parquet(path):
+        if mode != 'w':
+            raise ValueError(f"Cannot append to {path}: GeoParquet files are written in one go")
+        # The bbox covering column lets read_layer(bbox=...) skip row groups outside the box
+        gdf.to_parquet(path, index=False, write_covering_bbox=True)
+        return path
+    driver = DRIVERS.get(Path(path).suffix.lower())
+    gdf.to_file(path, layer=layer, driver=driver, mode=mode, engine='pyogrio', use_arrow=pq is not None)
+    return path
+
+
+def parquet_geo_column(path):
+    # GeoParquet metadata of the primary geometry column (encoding, crs, covering, ...)
+    geo = json.loads(pq.read_schema(path).metadata[b'geo'])
+    return geo['columns'][geo['primary_column']]
+
+
+def read_layer(path, columns=None, **kwargs):
+    # Read a GeoPackage, shapefile or GeoParquet file into a GeoDataFrame; extra keyword arguments
+    # (bbox, rows, layer, ...) are passed to the GDAL reader. As with GDAL, a GeoSeries bbox is
+    # reprojected to the file's CRS first.
+    if is_parquet(path):
+        bbox = kwargs.get('bbox')
+        if bbox is None:
+            return gpd.read_parquet(path, columns=columns)
+        geo_column = parquet_geo_column(path)
+        if isinstance(bbox, (gpd.GeoSeries, gpd.GeoDataFrame)):
+            # GeoParquet defaults to OGC:CRS84 when no crs is recorded
+            crs = geo_column.get('crs', 'OGC:CRS84')
+            if crs is not None and bbox.crs is not None:
+                bbox = bbox.to_crs(CRS.from_user_input(crs))
+            bbox = tuple(bbox.total_bounds)
+        if 'covering' in geo_column:
+            return gpd.read_parquet(path, columns=columns, bbox=bbox)
+        # Files written without a bbox covering column are read whole and filtered
+        gdf = gpd.read_parquet(path, columns=columns)
+        return gdf.cx[bbox[0]:bbox[2], bbox[1]:bbox[3]]
+    return gpd.read_file(path, columns=columns, engine='pyogrio', use_arrow=pq is not None, **kwargs)
+
+
+def wkt_table(df):
+    # Attribute table with the geometry as WKT, the way GeoDataFrame.to_csv writes it
+    df = pd.DataFrame(df)
+    if 'geometry' in df.columns:
+        df['geometry'] = shapely.to_wkt(gpd.GeoSeries(df['geometry']).values, rounding_precision=-1)
+    return df
+
+
+def parquet_table_columns(path):
+    # Attribute and geometry columns of a GeoParquet file, without the bbox covering and index columns
+    covering = parquet_geo_column(path).get('covering', {}).get('bbox', {})
+    hidden = {column[0] for column in covering.values()} | {'__index_level_0__'}
+    return [name for name in pq.read_schema(path).names if name not in hidden]
+
+
+def table_columns(path):
+    if is_parquet(path):
+        return pd.Index(parquet_table_columns(path))
+    return pd.read_csv(path, nrows=0, **CSV_READ_OPTIONS).columns
+
+
+def read_table(path):
+    # Read a CSV or GeoParquet file as a plain DataFrame (geometry as WKT, like the CSV outputs)
+    if is_parquet(path):
+        return wkt_table(gpd.read_parquet(path))
+    return pd.read_csv(path, **CSV_READ_OPTIONS)
+
+
+def iter_table(path, chunksize):
+    # Yield a CSV or GeoParquet file as DataFrames of up to chunksize rows
+    if not is_parquet(path):
+        yield from pd.read_csv(path, chunksize=chunksize, engine='c', **CSV_READ_OPTIONS)
+        return
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=parquet_table_columns(path)):
+        chunk = batch.to_pandas()
+        if 'geometry' in chunk.columns:
+            chunk['geometry'] = shapely.from_wkb(chunk['geometry'].to_numpy())
+        yield wkt_table(chunk)
@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parcel_cleaning import calculate_scores  # noqa: E402
+
+NaN = float('nan')
+SCORE_INPUTS = ['acreage_calc', 'Bacres', 'distance_to_transmission_line_miles', 'voltage_of_closest_line',
+                'mkt_val_land', 'acreage_adjacent_with_sameowner']
+
+# Rows on and around every bin edge of SCORING_CRITERIA, plus missing values and zero acreage, with the
+# Score the original row-by-row calculate_quality_score gave them. The defaults (100 acres, nothing
+# buildable, 5 mi from a 69 kV line, $3,000/acre, no adjacent land) score 0 on every criterion; rows
+# that vary acreage_calc also move the per-acre land value.
+BOUNDARY_SCORES = [
+    # acreage_calc, Bacres, distance (mi), voltage (kV), mkt_val_land, adjacent acreage, Score
+    (0, 0, 5, 69, 300000, 0, 0),
+    (249, 0, 5, 69, 300000, 0, 1),
+    (250, 0, 5, 69, 300000, 0, 6),
+    (500, 0, 5, 69, 300000, 0, 7),
+    (500.5, 0, 5, 69, 300000, 0, 2),
+    (501, 0, 5, 69, 300000, 0, 12),
+    (750, 0, 5, 69, 300000, 0, 13),
+    (750.5, 0, 5, 69, 300000, 0, 18),
+    (751, 0, 5, 69, 300000, 0, 18),
+    (NaN, 0, 5, 69, 300000, 0, 0),
+    (100, 29, 5, 69, 300000, 0, 0),
+    (100, 30, 5, 69, 300000, 0, 5),
+    (100, 50, 5, 69, 300000, 0, 10),
+    (100, 70, 5, 69, 300000, 0, 10),
+    (100, 70.5, 5, 69, 300000, 0, 15),
+    (100, NaN, 5, 69, 300000, 0, 0),
+    (100, 0, 0, 69, 300000, 0, 9),
+    (100, 0, 0.25, 69, 300000, 0, 6),
+    (100, 0, 0.5, 69, 300000, 0, 6),
+    (100, 0, 0.51, 69, 300000, 0, 3),
+    (100, 0, 1, 69, 300000, 0, 3),
+    (100, 0, 1.01, 69, 300000, 0, 0),
+    (100, 0, NaN, 69, 300000, 0, 0),
+    (100, 0, 5, 99, 300000, 0, 0),
+    (100, 0, 5, 100, 300000, 0, 1),
+    (100, 0, 5, 234, 300000, 0, 1),
+    (100, 0, 5, 235, 300000, 0, 2),
+    (100, 0, 5, 500, 300000, 0, 2),
+    (100, 0, 5, 501, 300000, 0, 3),
+    (100, 0, 5, NaN, 300000, 0, 0),
+    (100, 0, 5, 69, 0, 0, 0),
+    (100, 0, 5, 69, 49900, 0, 3),
+    (100, 0, 5, 69, 50000, 0, 2),
+    (100, 0, 5, 69, 99900, 0, 2),
+    (100, 0, 5, 69, 100000, 0, 1),
+    (100, 0, 5, 69, 200000, 0, 1),
+    (100, 0, 5, 69, 200100, 0, 0),
+    (100, 0, 5, 69, NaN, 0, 0),
+    (100, 0, 5, 69, 300000, 9, 0),
+    (100, 0, 5, 69, 300000, 10, 5),
+    (100, 0, 5, 69, 300000, 50, 10),
+    (100, 0, 5, 69, 300000, 100, 10),
+    (100, 0, 5, 69, 300000, 101, 15),
+    (100, 0, 5, 69, 300000, NaN, 0),
+    (0, 10, 0, 345, 1000, 10, 11),
+]
+
+
+def test_calculate_scores_matches_row_by_row_scores_at_bin_edges():
+    df = pd.DataFrame([row[:-1] for row in BOUNDARY_SCORES], columns=SCORE_INPUTS)
+    expected = [row[-1] for row in BOUNDARY_SCORES]
+    assert calculate_scores(df).tolist() == expected
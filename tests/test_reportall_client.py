@@ -0,0 +1,43 @@
+import os
+import sys
+
+import geopandas as gpd
+from shapely.geometry import Point
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from reportall_client import iter_pages, build_query_params, PageCache  # noqa: E402
+from stub_api import StubReportAll  # noqa: E402
+
+
+def stub_parcels(count):
+    return gpd.GeoDataFrame({'parcel_id': [f"{i:05d}" for i in range(count)]},
+                            geometry=[Point(i, i) for i in range(count)], crs='EPSG:4326')
+
+
+def test_iter_pages_keeps_page_order_and_recovers_from_throttling():
+    # Page 1 is throttled once and page 3 fails twice; the retrying session still yields every
+    # record, in the stub's order, with the concurrent pages put back in page order
+    parcels = stub_parcels(95)
+    with StubReportAll(parcels, page_size=10, failures={1: [429], 3: [503, 429]}) as stub:
+        pages = list(iter_pages(stub.url, build_query_params('39091'), max_workers=4))
+
+    assert [len(results) for results in pages] == [10] * 9 + [5]
+    assert [record['parcel_id'] for results in pages for record in results] == list(parcels['parcel_id'])
+    assert stub.requests[1] == 2
+    assert stub.requests[3] == 3
+    assert stub.requests[2] == 1
+
+
+def test_iter_pages_does_not_cache_empty_pages(tmp_path):
+    # An empty answer must not replace the county for the cache's lifetime
+    cache = PageCache(tmp_path)
+    params = build_query_params('39091')
+    with StubReportAll(stub_parcels(0)) as stub:
+        assert list(iter_pages(stub.url, params, cache=cache)) == []
+    assert cache.get(params, 1) is None
+
+    with StubReportAll(stub_parcels(5)) as stub:
+        assert len(list(iter_pages(stub.url, params, cache=cache))[0]) == 5
+    assert cache.get(params, 1) is not None
@@ -0,0 +1,132 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+
+from stage_io import read_layer
+
+# Side length of the square tiles (in UTM metres) each zone is split into
+TILE_SIZE_METERS = 100000
+# Lines this close (in degrees) to a UTM zone are stored with that zone as well, so parcels
+# near a zone edge still see the lines just across it
+ZONE_OVERLAP_DEGREES = 1.0
+MANIFEST_NAME = 'manifest.json'
+
+
+def utm_zone_crs(zone):
+    return f"EPSG:326{zone:02d}"
+
+
+def build_line_store(source_file, store_dir, tile_size=TILE_SIZE_METERS):
+    # One-time build: split the national transmission lines by UTM zone, project each zone once,
+    # cut it into tiles and save every tile as GeoParquet with a per-row bbox covering column.
+    # The manifest records each tile's bounds so runs only open the tiles they need.
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    print("Loading transmission lines...")
+    lines = read_layer(source_file).to_crs("EPSG:4326")
+    minx, _, maxx, _ = lines.total_bounds
+    first_zone = int((minx + 180) / 6) + 1
+    last_zone = int((maxx + 180) / 6) + 1
+
+    manifest = {
+        'source': str(source_file),
+        'source_mtime': os.path.getmtime(source_file),
+        'tile_size': tile_size,
+        'zones': {}
+    }
+
+    for zone in range(first_zone, last_zone + 1):
+        west = (zone - 1) * 6 - 180 - ZONE_OVERLAP_DEGREES
+        east = zone * 6 - 180 + ZONE_OVERLAP_DEGREES
+        zone_lines = lines.cx[west:east, :]
+        if zone_lines.empty:
+            continue
+
+        crs = utm_zone_crs(zone)
+        print(f"Building tiles for {crs} ({len(zone_lines)} lines)...")
+        zone_lines = zone_lines.to_crs(crs)
+
+        # Assign each line to the tile holding the centre of its bounding box; the tile's recorded
+        # bounds are the full extent of its lines, so overlap tests against them stay exact
+        bounds = zone_lines.geometry.bounds
+        tile_x = ((bounds['minx'] + bounds['maxx']) / 2 // tile_size).astype(int)
+        tile_y = ((bounds['miny'] + bounds['maxy']) / 2 // tile_size).astype(int)
+
+        zone_dir = store_dir / crs.replace(':', '_')
+        zone_dir.mkdir(exist_ok=True)
+        tiles = []
+        for (x, y), tile in zone_lines.groupby([tile_x, tile_y]):
+            tile_file = zone_dir / f"{x}_{y}.parquet"
+            tile.to_parquet(tile_file, write_covering_bbox=True)
+            tiles.append({
+                'file': str(tile_file.relative_to(store_dir)),
+                'bounds': [float(b) for b in tile.total_bounds],
+                'count': len(tile)
+            })
+        manifest['zones'][crs] = tiles
+
+    with open(store_dir / MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"Transmission line store written to: {store_dir}")
+    return str(store_dir / MANIFEST_NAME)
+
+
+def line_store_exists(store_dir):
+    return store_dir is not None and (Path(store_dir) / MANIFEST_NAME).is_file()
+
+
+def line_store_is_current(store_dir, source_file):
+    # The store is stale once the source lines have been replaced or edited after it was built.
+    # Without the source file at hand the store is all there is, so it counts as current.
+    if not line_store_exists(store_dir):
+        return False
+    if not os.path.isfile(source_file):
+        return True
+    with open(Path(store_dir) / MANIFEST_NAME) as f:
+        manifest = json.load(f)
+    return os.path.getmtime(source_file) <= manifest.get('source_mtime', 0)
+
+
+def load_lines_near(store_dir, crs, bounds, margin):
+    # Load only the lines whose bounding boxes overlap `bounds` grown by `margin` (CRS units).
+    # Returns (lines, complete) where complete means every tile of the zone was inside the search
+    # area, or (None, False) when the store has no tiles for this CRS.
+    with open(Path(store_dir) / MANIFEST_NAME) as f:
+        manifest = json.load(f)
+
+    tiles = manifest['zones'].get(crs)
+    if tiles is None:
+        return None, False
+
+    minx, miny, maxx, maxy = bounds
+    search = (minx - margin, miny - margin, maxx + margin, maxy + margin)
+
+    frames = []
+    complete = True
+    for tile in tiles:
+        tminx, tminy, tmaxx, tmaxy = tile['bounds']
+        if tmaxx < search[0] or tminx > search[2] or tmaxy < search[1] or tminy > search[3]:
+            complete = False
+            continue
+        if tminx < search[0] or tminy < search[1] or tmaxx > search[2] or tmaxy > search[3]:
+            complete = False
+        frames.append(gpd.read_parquet(Path(store_dir) / tile['file'], bbox=search))
+
+    if not frames:
+        return gpd.GeoDataFrame({'VOLTAGE': []}, geometry=[], crs=crs), complete
+
+    lines = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=crs)
+    return lines, complete
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python tx_line_store.py <Electric_Power_Transmission_Lines.shp> <store_dir>")
+        sys.exit(1)
+    build_line_store(sys.argv[1], sys.argv[2])
@@ -1,14 +1,16 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import geopandas as gpd
 from pathlib import Path
-from tqdm import tqdm
 from shapely.geometry import Point
 import threading
 import time
 import subprocess
 import sys
 import os
+from tx_proximity import add_transmission_line_distances, subset_near_lines, NEAREST_LINE_COUNT, VOLTAGE_CLASSES_KV
+from instrumentation import subscribe_progress, unsubscribe_progress
+from proximity_checkpoint import checkpoint_dir_for, clear_checkpoint
+from stage_io import read_layer, write_layer, stage_output_path
 
 
 class App:
@@ -21,7 +23,7 @@ class App:
         self.frame.pack()
 
         # Add a label and button to select input file
-        self.label = tk.Label(self.frame, text="Select .gpkg or .shp file:")
+        self.label = tk.Label(self.frame, text="Select .gpkg, .shp or .parquet file:")
         self.label.grid(row=0, column=0, sticky=tk.W)
 
         self.file_button = tk.Button(self.frame, text="Browse", command=self.browse_file)
@@ -40,24 +42,30 @@ class App:
         self.progress_label = tk.Label(self.frame, text="0%")
         self.progress_label.grid(row=3, column=0, columnspan=2, pady=10)
 
+        # Opt-in multi-query proximity (extra columns for siting)
+        self.multi_query = tk.BooleanVar(value=False)
+        self.multi_query_check = tk.Checkbutton(
+            self.frame, variable=self.multi_query,
+            text=f"Also measure the {NEAREST_LINE_COUNT} nearest lines and the closest "
+                 f"{' / '.join(str(kv) for kv in VOLTAGE_CLASSES_KV)} kV lines")
+        self.multi_query_check.grid(row=4, column=0, columnspan=2, sticky=tk.W)
+
         # Button to start processing
         self.start_button = tk.Button(self.frame, text="Start Processing", command=self.start_processing)
-        self.start_button.grid(row=4, column=0, columnspan=2, pady=10)
+        self.start_button.grid(row=5, column=0, columnspan=2, pady=10)
 
         # Cancel button
         self.cancel_button = tk.Button(self.frame, text="Cancel", command=self.cancel_processing, state=tk.DISABLED)
-        self.cancel_button.grid(row=5, column=0, columnspan=2, pady=10)
+        self.cancel_button.grid(row=6, column=0, columnspan=2, pady=10)
 
         # Status label
         self.status_label = tk.Label(self.frame, text="")
-        self.status_label.grid(row=6, column=0, columnspan=2)
+        self.status_label.grid(row=7, column=0, columnspan=2)
 
         # Initialize variables
         self.input_file = initial_file
         self.output_file = None
         self.subset_file = None
-        self.total_parcels = 0
-        self.processed_parcels = 0
         self.script_thread = None
         self.cancel_requested = False
 
@@ -65,7 +73,8 @@ class App:
             self.file_label.config(text=f"Selected file: {self.input_file}")
 
     def browse_file(self):
-        self.input_file = filedialog.askopenfilename(filetypes=[("GeoPackage files", "*.gpkg"), ("Shapefile", "*.shp")])
+        self.input_file = filedialog.askopenfilename(filetypes=[("GeoPackage files", "*.gpkg"), ("Shapefile", "*.shp"),
+                                                                ("GeoParquet files", "*.parquet")])
         if self.input_file:
             self.file_label.config(text=f"Selected file: {self.input_file}")
 
@@ -80,19 +89,21 @@ class App:
         self.cancel_button.config(state=tk.NORMAL)
         self.cancel_requested = False
 
+        # Progress events from the worker thread move the bar as parcels complete
+        subscribe_progress(self.on_progress)
+
         # Start a new thread to run the script
         self.script_thread = threading.Thread(target=self.run_script)
         self.script_thread.start()
 
-        # Start periodic update of progress bar
-        self.root.after(5000, self.update_progress)
-
     def run_script(self):
         start_time = time.time()
         try:
-            self.output_file, self.subset_file = append_distance_to_transmission_lines(self.input_file,
-                                                                                       self.update_progress,
-                                                                                       self.is_cancel_requested)
+            multi_query = {'nearest_count': NEAREST_LINE_COUNT, 'voltage_classes': VOLTAGE_CLASSES_KV} \
+                if self.multi_query.get() else {}
+            self.output_file, self.subset_file = append_distance_to_transmission_lines(self.input_file, None,
+                                                                                       self.is_cancel_requested,
+                                                                                       **multi_query)
             end_time = time.time()
             processing_time = end_time - start_time
 
@@ -115,17 +126,19 @@ class App:
             messagebox.showerror("Error", f"An error occurred: {str(e)}")
             self.status_label.config(text="Error")
         finally:
+            unsubscribe_progress(self.on_progress)
             self.cancel_button.config(state=tk.DISABLED)
 
-    def update_progress(self):
-        if self.script_thread and self.script_thread.is_alive():
-            if self.total_parcels > 0:
-                current_progress = (self.processed_parcels / self.total_parcels) * 100
-                self.progress.set(current_progress)
-                self.progress_label.config(text=f"{current_progress:.2f}%")
+    def on_progress(self, stage, processed, total):
+        # Called on the worker thread; Tk widgets are only updated from the main loop
+        if stage == 'proximity':
+            self.root.after(0, self.update_progress, processed, total)
 
-            # Schedule next update
-            self.root.after(5000, self.update_progress)
+    def update_progress(self, processed, total):
+        if total > 0:
+            current_progress = (processed / total) * 100
+            self.progress.set(current_progress)
+            self.progress_label.config(text=f"{current_progress:.2f}%")
 
     def cancel_processing(self):
         self.cancel_requested = True
@@ -143,61 +156,37 @@ class App:
         tk.Button(completion_window, text="Acknowledge", command=self.root.destroy, padx=20, pady=10).pack()
 
 
-def get_utm_crs(geometry):
-    lon = geometry.centroid.x
-    utm_zone = int((lon + 180) / 6) + 1
-    return f"EPSG:326{utm_zone if geometry.centroid.y >= 0 else utm_zone + 100}"
-
-
-def append_distance_to_transmission_lines(input_file, progress_callback, cancel_callback):
-    parcels = gpd.read_file(input_file)
-
-    # Remove features where land_use_class is 'Tax Exempt'
-    if 'land_use_class' in parcels.columns:
-        parcels = parcels[parcels['land_use_class'] != 'Tax Exempt']
-
-    transmission_lines_file = r"C:\Users\georg\OneDrive\Documents\GIS projects\US Electric Infra\Electric_Power_Transmission_Lines.shp"
-    transmission_lines = gpd.read_file(transmission_lines_file)
-
-    utm_crs = get_utm_crs(parcels.unary_union)
-    parcels = parcels.to_crs(utm_crs)
-    transmission_lines = transmission_lines.to_crs(utm_crs)
-
-    app.total_parcels = len(parcels)
-
-    parcels['distance_to_transmission_line_miles'] = None
-    parcels['voltage_of_closest_line'] = None
-
-    for idx, parcel in tqdm(parcels.iterrows(), total=len(parcels), desc="Processing parcels"):
-        if cancel_callback():
-            return None, None
-
-        closest_line_idx = transmission_lines.distance(parcel.geometry).idxmin()
-        closest_line = transmission_lines.loc[closest_line_idx]
-
-        distance_meters = parcel.geometry.distance(closest_line.geometry)
-        distance_miles = round(distance_meters * 0.000621371, 2)
-
-        voltage = int(round(closest_line['VOLTAGE']))
-
-        parcels.at[idx, 'distance_to_transmission_line_miles'] = distance_miles
-        parcels.at[idx, 'voltage_of_closest_line'] = voltage
-
-        # Increment processed parcels count
-        app.processed_parcels += 1
-
-        # Update progress in tqdm (not needed here, since we're using after for the GUI update)
-        # tqdm.get_lock().acquire()
-        # tqdm.get_lock().release()
-
-    output_file = str(Path(input_file).parent / (Path(input_file).stem + "_dist_from_line" + Path(input_file).suffix))
-    parcels.to_file(output_file)
+def append_distance_to_transmission_lines(input_file, progress_callback, cancel_callback, bulk=True,
+                                          max_distance_miles=None, nearest_count=1, voltage_classes=()):
+    # Progress is also published as 'proximity' events (see instrumentation.subscribe_progress).
+    # Finished chunks are checkpointed next to the input, so a cancelled or crashed run resumes
+    # where it stopped when started again on the same file. nearest_count and voltage_classes add the
+    # distances to the nearest lines and the closest line of every voltage class as extra columns.
+    checkpoint_dir = checkpoint_dir_for(input_file)
+    parcels = read_layer(input_file)
+    parcels = add_transmission_line_distances(parcels, bulk=bulk, max_distance_miles=max_distance_miles,
+                                              progress_callback=progress_callback, cancel_callback=cancel_callback,
+                                              checkpoint_dir=checkpoint_dir, nearest_count=nearest_count,
+                                              voltage_classes=voltage_classes)
+    if parcels is None:
+        return None, None
+
+    # Outputs keep the input's format unless the proximity stage is given one (see stage_io.stage_formats)
+    base = Path(input_file).parent / Path(input_file).stem
+    suffix = Path(input_file).suffix
+    if (nearest_count > 1 or voltage_classes) and suffix.lower() == '.shp':
+        # Shapefile field names are cut to 10 characters, which makes the extra columns indistinguishable
+        print("Writing GeoPackage outputs: the multi-query columns do not fit shapefile field names")
+        suffix = '.gpkg'
+    output_file = write_layer(parcels, stage_output_path(f"{base}_dist_from_line", 'proximity',
+                                                         default_suffix=suffix))
 
     # Create a subset with parcels within 2 miles from the transmission line
-    subset = parcels[parcels['distance_to_transmission_line_miles'] <= 2]
-    subset = subset.drop_duplicates(subset='parcel_id')
-    subset_file = str(Path(input_file).parent / (Path(input_file).stem + "_2m" + Path(input_file).suffix))
-    subset.to_file(subset_file)
+    subset = subset_near_lines(parcels)
+    subset_file = write_layer(subset, stage_output_path(f"{base}_2m", 'proximity', default_suffix=suffix))
+
+    # Both outputs are on disk, the checkpoint is no longer needed
+    clear_checkpoint(checkpoint_dir)
 
     return output_file, subset_file
 
@@ -0,0 +1,322 @@
+import numpy as np
+import pandas as pd
+import shapely
+from tqdm import tqdm
+from tx_line_store import load_lines_near, line_store_exists, line_store_is_current
+from instrumentation import emit_progress
+from proximity_checkpoint import ProximityCheckpoint, parcels_fingerprint
+from stage_io import read_layer
+
+# Conversion factor used throughout the proximity analysis
+METERS_TO_MILES = 0.000621371
+
+TRANSMISSION_LINES_FILE = r"C:\Users\georg\OneDrive\Documents\GIS projects\US Electric Infra\Electric_Power_Transmission_Lines.shp"
+# Pre-projected, tiled copy of the lines built once with tx_line_store.py
+TRANSMISSION_LINES_STORE = r"C:\Users\georg\OneDrive\Documents\GIS projects\US Electric Infra\tx_line_store"
+
+# Parcels farther than this from a line are left out of the "_2m" subset
+SUBSET_DISTANCE_MILES = 2
+
+# First search margin used against the line store when no max distance is given
+STORE_SEARCH_MILES = 10
+
+# Parcels measured (and checkpointed) together
+CHUNK_SIZE = 5000
+
+# Multi-query proximity used for siting: distances to this many nearest lines, and the closest line
+# at or above each of these voltages (kV)
+NEAREST_LINE_COUNT = 3
+VOLTAGE_CLASSES_KV = (138, 345)
+
+
+def get_utm_crs(geometry):
+    lon = geometry.centroid.x
+    utm_zone = int((lon + 180) / 6) + 1
+    return f"EPSG:326{utm_zone if geometry.centroid.y >= 0 else utm_zone + 100}"
+
+
+def proximity_columns(nearest_count=1, voltage_classes=()):
+    # Columns the proximity stage adds: the closest line's distance and voltage, the distances to the
+    # 2nd..nearest_count-th nearest lines, and the closest line's distance and voltage per voltage class
+    columns = ['distance_to_transmission_line_miles', 'voltage_of_closest_line']
+    columns += [f'distance_to_transmission_line_{n}_miles' for n in range(2, nearest_count + 1)]
+    for kv in voltage_classes:
+        columns += [f'distance_to_{kv}kv_line_miles', f'voltage_of_closest_{kv}kv_line']
+    return columns
+
+
+def nearest_line(parcels, transmission_lines, max_distance=None):
+    # (distance in metres, voltage) of the closest line per parcel; NaN/None where none is in range.
+    # Lines at the same distance from a parcel (common at 0, a parcel crossed by two lines) are broken
+    # by taking the highest voltage, the same rule as closest_line_index, so the result does not
+    # depend on the order the lines were read in.
+    distances = np.full(len(parcels), np.nan)
+    # Keep voltages as plain ints (None when unmatched) so the output matches the per-parcel loop
+    voltage = np.full(len(parcels), None, dtype=object)
+    if len(transmission_lines) == 0:
+        return distances, voltage
+
+    (parcel_pos, line_pos), line_distances = transmission_lines.sindex.nearest(
+        parcels.geometry, return_all=True, return_distance=True, max_distance=max_distance)
+    # Every tied line is returned; keep each parcel's highest voltage one
+    order = np.lexsort((-transmission_lines['VOLTAGE'].to_numpy()[line_pos], parcel_pos))
+    parcel_pos, line_pos, line_distances = parcel_pos[order], line_pos[order], line_distances[order]
+    first = np.r_[True, parcel_pos[1:] != parcel_pos[:-1]]
+    parcel_pos, line_pos, line_distances = parcel_pos[first], line_pos[first], line_distances[first]
+    distances[parcel_pos] = line_distances
+    voltage[parcel_pos] = [int(round(v)) for v in transmission_lines['VOLTAGE'].to_numpy()[line_pos]]
+    return distances, voltage
+
+
+def closest_line_index(line_distances, line_voltages):
+    # Index label of the closest line, the highest voltage one among lines at the same distance
+    closest = line_distances[line_distances == line_distances.min()]
+    return line_voltages[closest.index].idxmax()
+
+
+def k_nearest_line_distances(parcels, transmission_lines, nearest_count, first_distances, max_distance=None):
+    # Distances (metres) to the nearest_count nearest lines of every parcel, one row per parcel and
+    # NaN where fewer lines are in range. Each parcel's lines are collected with a 'dwithin' index
+    # query around it, starting from twice its closest line's distance and doubling the radius only
+    # for parcels that still have fewer than nearest_count candidates.
+    result = np.full((len(parcels), nearest_count), np.nan)
+    # Null and empty lines are never returned by the index, so they must not count towards the lines wanted
+    transmission_lines = transmission_lines[~transmission_lines.geometry.isna() & ~transmission_lines.geometry.is_empty]
+    if len(transmission_lines) == 0:
+        return result
+    geometries = parcels.geometry.to_numpy()
+    line_geometries = transmission_lines.geometry.to_numpy()
+    wanted = min(nearest_count, len(transmission_lines))
+    # No parcel is farther from any line than the diagonal of the box around both layers
+    minx, miny, maxx, maxy = np.vstack([parcels.total_bounds, transmission_lines.total_bounds]).T
+    covering_radius = np.hypot(maxx.max() - minx.min(), maxy.max() - miny.min())
+
+    todo = ~np.isnan(first_distances)
+    radius = np.where(todo, np.maximum(first_distances * 2, first_distances + 1 / METERS_TO_MILES), 0)
+    if max_distance is not None:
+        radius = np.minimum(radius, max_distance)
+
+    while todo.any():
+        positions = np.flatnonzero(todo)
+        parcel_pos, line_pos = transmission_lines.sindex.query(
+            geometries[positions], predicate='dwithin', distance=radius[positions])
+        distances = shapely.distance(geometries[positions][parcel_pos], line_geometries[line_pos])
+
+        # Rank each parcel's candidates by distance and keep the first nearest_count
+        order = np.lexsort((distances, parcel_pos))
+        parcel_pos, distances = parcel_pos[order], distances[order]
+        counts = np.bincount(parcel_pos, minlength=len(positions))
+        rank = np.arange(len(parcel_pos)) - (np.cumsum(counts) - counts)[parcel_pos]
+        kept = rank < nearest_count
+        result[positions[parcel_pos[kept]], rank[kept]] = distances[kept]
+
+        finished = (counts >= wanted) | (radius[positions] >= covering_radius)
+        if max_distance is not None:
+            finished |= radius[positions] >= max_distance
+        todo[positions[finished]] = False
+        radius[positions[~finished]] *= 2
+        if max_distance is not None:
+            radius = np.minimum(radius, max_distance)
+
+    return result
+
+
+def nearest_transmission_lines(parcels, transmission_lines, max_distance_miles=None, nearest_count=1,
+                               voltage_classes=()):
+    # Find the closest transmission line for every parcel in one batched spatial index query.
+    # Both layers must already be in the same projected CRS (metres).
+    # Parcels with no line within max_distance_miles are left without a distance/voltage.
+    # nearest_count > 1 adds the distances to that many nearest lines, and every voltage class adds
+    # the closest line at or above that voltage (one index per class); see proximity_columns.
+    max_distance = max_distance_miles / METERS_TO_MILES if max_distance_miles is not None else None
+
+    distances, voltage = nearest_line(parcels, transmission_lines, max_distance)
+    result = pd.DataFrame({
+        'distance_to_transmission_line_miles': np.round(distances * METERS_TO_MILES, 2),
+        'voltage_of_closest_line': voltage
+    }, index=parcels.index)
+
+    if nearest_count > 1:
+        k_nearest = k_nearest_line_distances(parcels, transmission_lines, nearest_count, distances, max_distance)
+        for n in range(2, nearest_count + 1):
+            result[f'distance_to_transmission_line_{n}_miles'] = np.round(k_nearest[:, n - 1] * METERS_TO_MILES, 2)
+
+    for kv in voltage_classes:
+        class_lines = transmission_lines[transmission_lines['VOLTAGE'] >= kv]
+        class_distances, class_voltage = nearest_line(parcels, class_lines, max_distance)
+        result[f'distance_to_{kv}kv_line_miles'] = np.round(class_distances * METERS_TO_MILES, 2)
+        result[f'voltage_of_closest_{kv}kv_line'] = class_voltage
+
+    return result
+
+
+def nearest_transmission_lines_in_store(parcels, store_dir, max_distance_miles=None,
+                                        search_miles=STORE_SEARCH_MILES, nearest_count=1, voltage_classes=()):
+    # Same as nearest_transmission_lines, but only loads the pre-projected store tiles around the
+    # parcels. `parcels` must already be in the UTM CRS the store was built for.
+    # Returns None if the store has no tiles for that CRS.
+    crs = parcels.crs.to_string()
+    bounds = parcels.total_bounds
+    margin_miles = max_distance_miles if max_distance_miles is not None else search_miles
+
+    while True:
+        lines, complete = load_lines_near(store_dir, crs, bounds, margin_miles / METERS_TO_MILES)
+        if lines is None:
+            return None
+
+        nearest = nearest_transmission_lines(parcels, lines, max_distance_miles, nearest_count, voltage_classes)
+        if max_distance_miles is not None or complete:
+            return nearest
+
+        # Without a search radius a parcel's result is only exact if every line it was measured to
+        # lies inside the loaded margin, so widen the search until that holds for every parcel
+        distances = nearest[[col for col in nearest.columns if col.startswith('distance_')]]
+        if distances.notna().all().all() and distances.max().max() < margin_miles:
+            return nearest
+        margin_miles *= 2
+
+
+def drop_tax_exempt(parcels):
+    # Remove features where land_use_class is 'Tax Exempt'
+    if 'land_use_class' in parcels.columns:
+        parcels = parcels[parcels['land_use_class'] != 'Tax Exempt']
+    return parcels
+
+
+def add_transmission_line_distances(parcels, transmission_lines_file=TRANSMISSION_LINES_FILE,
+                                    transmission_lines_store=TRANSMISSION_LINES_STORE, bulk=True,
+                                    max_distance_miles=None, progress_callback=None, cancel_callback=None,
+                                    checkpoint_dir=None, chunk_size=CHUNK_SIZE, nearest_count=1, voltage_classes=()):
+    # Project the parcels to their UTM zone and append the distance to and voltage of the closest
+    # transmission line. Tax exempt parcels are dropped. Progress is published as 'proximity' events
+    # and passed to progress_callback(processed, total); returns None if cancel_callback() asks to stop.
+    # Parcels are measured chunk_size at a time. With a checkpoint_dir, every finished chunk is saved
+    # there and a later run on the same parcels only measures the ones not saved yet.
+    # nearest_count and voltage_classes add the multi-query columns (see proximity_columns) in the same pass.
+    callback = progress_callback or (lambda processed, total: None)
+    cancel_callback = cancel_callback or (lambda: False)
+
+    def progress_callback(processed, total):
+        emit_progress('proximity', processed, total)
+        callback(processed, total)
+
+    parcels = drop_tax_exempt(parcels)
+    utm_crs = get_utm_crs(parcels.unary_union)
+    parcels = parcels.to_crs(utm_crs)
+
+    columns = proximity_columns(nearest_count, voltage_classes)
+    for col in columns:
+        parcels[col] = None if col.startswith('voltage_') else np.nan
+    result_cols = [parcels.columns.get_loc(col) for col in columns]
+    positions = dict(zip(columns, result_cols))
+    distance_col, voltage_col = result_cols[:2]
+    done = np.zeros(len(parcels), dtype=bool)
+
+    checkpoint = None
+    if checkpoint_dir:
+        checkpoint = ProximityCheckpoint(checkpoint_dir, parcels_fingerprint(parcels, max_distance_miles, columns))
+        saved = checkpoint.load()
+        if saved is not None:
+            rows = saved['row'].to_numpy()
+            for col, position in zip(columns, result_cols):
+                parcels.iloc[rows, position] = saved[col].to_numpy()
+            done[rows] = True
+            print(f"Resuming from checkpoint: {len(rows)} of {len(parcels)} parcels already measured")
+
+    def save_rows(rows):
+        if checkpoint is not None:
+            checkpoint.save(rows, parcels['parcel_id'].to_numpy()[rows], parcels.iloc[rows, result_cols])
+
+    progress_callback(int(done.sum()), len(parcels))
+
+    transmission_lines = None
+    if bulk:
+        use_store = line_store_is_current(transmission_lines_store, transmission_lines_file)
+        if line_store_exists(transmission_lines_store) and not use_store:
+            print(f"Transmission line store {transmission_lines_store} is older than {transmission_lines_file}; "
+                  f"using the shapefile until the store is rebuilt with tx_line_store.py")
+        # Resolve the closest line for a whole chunk of parcels in one spatial index query. Parcels
+        # beyond max_distance_miles (if set) are never measured and keep an empty distance.
+        for start in range(0, len(parcels), chunk_size):
+            if cancel_callback():
+                return None
+            rows = np.arange(start, min(start + chunk_size, len(parcels)))
+            rows = rows[~done[rows]]
+            if len(rows) == 0:
+                continue
+            chunk = parcels.iloc[rows]
+
+            nearest = None
+            if use_store:
+                nearest = nearest_transmission_lines_in_store(chunk, transmission_lines_store, max_distance_miles,
+                                                              nearest_count=nearest_count,
+                                                              voltage_classes=voltage_classes)
+            if nearest is None:
+                # No store for this UTM zone, fall back to the national shapefile
+                if transmission_lines is None:
+                    transmission_lines = read_layer(transmission_lines_file).to_crs(utm_crs)
+                nearest = nearest_transmission_lines(chunk, transmission_lines, max_distance_miles, nearest_count,
+                                                     voltage_classes)
+
+            for col, position in zip(columns, result_cols):
+                parcels.iloc[rows, position] = nearest[col].to_numpy()
+            done[rows] = True
+            save_rows(rows)
+            progress_callback(int(done.sum()), len(parcels))
+    else:
+        transmission_lines = read_layer(transmission_lines_file).to_crs(utm_crs)
+        line_voltages = transmission_lines['VOLTAGE']
+        max_distance = max_distance_miles / METERS_TO_MILES if max_distance_miles is not None else np.inf
+        pending = []
+        todo = np.flatnonzero(~done)
+        for row in tqdm(todo, desc="Processing parcels"):
+            if cancel_callback():
+                # Keep the parcels finished since the last checkpoint
+                save_rows(pending)
+                return None
+
+            geometry = parcels.geometry.iloc[row]
+            line_distances = transmission_lines.distance(geometry)
+            # Like the bulk mode, lines beyond max_distance_miles do not count; a parcel with none in
+            # range keeps an empty distance
+            line_distances = line_distances[line_distances <= max_distance]
+            if not line_distances.empty:
+                closest_line_idx = closest_line_index(line_distances, line_voltages)
+                closest_line = transmission_lines.loc[closest_line_idx]
+
+                distance_meters = geometry.distance(closest_line.geometry)
+                distance_miles = round(distance_meters * METERS_TO_MILES, 2)
+
+                voltage = int(round(closest_line['VOLTAGE']))
+
+                parcels.iat[row, distance_col] = distance_miles
+                parcels.iat[row, voltage_col] = voltage
+
+            nearest_distances = np.sort(line_distances.to_numpy())[1:nearest_count]
+            for n, distance_meters in enumerate(nearest_distances, start=2):
+                parcels.iat[row, positions[f'distance_to_transmission_line_{n}_miles']] = \
+                    round(distance_meters * METERS_TO_MILES, 2)
+            for kv in voltage_classes:
+                class_distances = line_distances[line_voltages >= kv]
+                if class_distances.empty:
+                    continue
+                class_line_idx = closest_line_index(class_distances, line_voltages)
+                parcels.iat[row, positions[f'distance_to_{kv}kv_line_miles']] = \
+                    round(class_distances[class_line_idx] * METERS_TO_MILES, 2)
+                parcels.iat[row, positions[f'voltage_of_closest_{kv}kv_line']] = int(round(line_voltages[class_line_idx]))
+            done[row] = True
+            pending.append(row)
+
+            if len(pending) == chunk_size:
+                save_rows(pending)
+                pending = []
+            progress_callback(int(done.sum()), len(parcels))
+        save_rows(pending)
+
+    return parcels
+
+
+def subset_near_lines(parcels, max_distance_miles=SUBSET_DISTANCE_MILES):
+    # Create a subset with parcels within max_distance_miles of a transmission line
+    subset = parcels[parcels['distance_to_transmission_line_miles'] <= max_distance_miles]
+    return subset.drop_duplicates(subset='parcel_id')